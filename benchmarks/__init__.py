@@ -0,0 +1 @@
+"""Benchmarks for librarian, see ``benchmarks.suite``."""
@@ -0,0 +1,209 @@
+"""
+Benchmarks of the hot paths of librarian at scale.
+
+Run with ``python -m benchmarks.suite`` from the root of the repository, see
+``--help`` for the options. Results are printed and may be written as JSON
+with ``--output`` so that they can be compared with a later run using
+``--compare``.
+"""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+import librarian
+from librarian.card import Card
+from librarian.deck import Deck
+from librarian.library import Library
+from librarian.metrics import CLOCK
+
+
+SIZES = (10000, 100000, 1000000)
+ATTRIBUTES = ("creature", "spell", "artifact", "red", "blue", "green",
+              "flying", "haste", "legendary", "token")
+PHASES = ("attack", "block", "upkeep", "draw")
+
+
+def generate_cards(count, seed=0):
+    """
+    Generate count cards with codes from 1 to count, random attributes,
+    abilities and info. The same seed always generates the same cards.
+    """
+    rng = random.Random(seed)
+    for code in range(1, count + 1):
+        card = Card(code, "Card {0} {1}".format(code, rng.choice(
+            ("Ant", "Drake", "Golem", "Wisp"))))
+        for attribute in rng.sample(ATTRIBUTES, rng.randint(1, 3)):
+            card.add_attribute(attribute)
+        card.add_ability(rng.choice(PHASES),
+                         "Ability {0}".format(rng.randint(1, 100)))
+        card.set_info("cost", rng.randint(0, 9), False)
+        card.set_info("text", "Rules text of card {0}".format(code))
+        yield card
+
+
+def generate_library(dbname, count, seed=0, batch=10000):
+    """Create a library at dbname filled with count generated cards."""
+    library = Library(dbname)
+    cards = []
+    for card in generate_cards(count, seed):
+        cards.append(card)
+        if len(cards) == batch:
+            library.save_cards(cards)
+            cards = []
+    library.save_cards(cards)
+    return library
+
+
+def timed(operations, func):
+    """
+    Call func and return the number of operations it performed, as given or
+    returned by func if operations is None, and the seconds it took.
+    """
+    start = CLOCK()
+    result = func()
+    seconds = CLOCK() - start
+    return (result if operations is None else operations), seconds
+
+
+def cases(library, size, rng, repeat):
+    """
+    Generate the name, number of operations and seconds of each benchmark
+    against a library of the given size. The operations of searches and
+    ``retrieve_all`` are the number of rows they produced.
+    """
+    codes = [rng.randint(1, size) for _ in range(repeat)]
+
+    def load(cache):
+        def run():
+            for code in codes:
+                library.load_card(code, cache)
+        return run
+
+    library.card_cache.clear()
+    library.cachelimit = repeat
+    yield ("load_card_miss",) + timed(repeat, load(False))
+    load(True)()
+    yield ("load_card_hit",) + timed(repeat, load(True))
+    yield ("load_cards",) + timed(repeat, lambda: library.load_cards(
+        codes, cache=False))
+
+    saved = list(generate_cards(repeat, seed=size))
+    yield ("save_card",) + timed(min(repeat, 200), lambda: [
+        library.save_card(card) for card in saved[:200]])
+    yield ("save_cards",) + timed(repeat, lambda: library.save_cards(saved))
+
+    searches = dict(code=dict(code=size // 2), name=dict(name="Drake"),
+                    attributes=dict(attributes=["flying", "red"]),
+                    abilities=dict(abilities={"attack": "Ability 7"}),
+                    info=dict(info={"cost": 3}))
+    for field, kwargs in sorted(searches.items()):
+        yield ("filter_search_" + field,) + timed(
+            None, lambda: len(library.filter_search(**kwargs)))
+
+    yield ("retrieve_all",) + timed(None, lambda: sum(
+        1 for _ in library.retrieve_all(cache=False)))
+    yield ("retrieve_all_fields",) + timed(None, lambda: sum(
+        1 for _ in library.retrieve_all(fields=("code", "name"))))
+
+    library.card_index()
+    decks = [Deck(library, [rng.randint(1, size) for _ in range(60)],
+                  rng=random.Random(number)) for number in range(100)]
+
+    def draw():
+        for deck in decks:
+            deck.shuffle()
+            deck.top_cards(7, remove=False)
+    library.cachelimit = 10000
+    draw()
+    yield ("deck_draw",) + timed(len(decks), draw)
+    yield ("deck_count_attribute",) + timed(len(decks), lambda: [
+        deck.contians_attribute("flying") for deck in decks])
+    yield ("deck_attribute_histogram",) + timed(len(decks), lambda: [
+        deck.attribute_histogram() for deck in decks])
+
+
+def run(sizes=SIZES, repeat=1000, seed=0, directory=None):
+    """
+    Run every benchmark against a generated library of each size and return
+    the results as a dict ready to be stored as JSON.
+    """
+    results = []
+    for size in sizes:
+        workdir = tempfile.mkdtemp(dir=directory)
+        try:
+            start = CLOCK()
+            library = generate_library(os.path.join(workdir, "cards.db"),
+                                       size, seed)
+            results.append(dict(case="generate", size=size, operations=size,
+                                seconds=CLOCK() - start))
+            rng = random.Random(seed)
+            for case, operations, seconds in cases(library, size, rng,
+                                                   repeat):
+                results.append(dict(case=case, size=size,
+                                    operations=operations, seconds=seconds))
+            library.close()
+        finally:
+            shutil.rmtree(workdir)
+
+    for result in results:
+        result["per_second"] = (result["operations"] / result["seconds"]
+                                if result["seconds"] else 0.0)
+    return dict(librarian=librarian.__version__,
+                python=platform.python_version(),
+                sqlite=sqlite3.sqlite_version, machine=platform.machine(),
+                repeat=repeat, seed=seed, results=results)
+
+
+def compare(previous, current):
+    """
+    Return a list of the case, size and the ratio of the current to the
+    previous operations per second of each benchmark found in both results.
+    """
+    before = dict(((result["case"], result["size"]), result["per_second"])
+                  for result in previous["results"])
+    ratios = []
+    for result in current["results"]:
+        key = (result["case"], result["size"])
+        if before.get(key):
+            ratios.append(key + (result["per_second"] / before[key],))
+    return ratios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                        help="library sizes to benchmark")
+    parser.add_argument("--repeat", type=int, default=1000,
+                        help="lookups and saves per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this file")
+    parser.add_argument("--compare", help="compare with a previous results "
+                        "file, ratios below 1 are slower")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat, args.seed)
+    for result in results["results"]:
+        sys.stdout.write("{case:>26} {size:>8} {per_second:>14.1f}/s\n".format(
+            **result))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as previous:
+            ratios = compare(json.load(previous), results)
+        sys.stdout.write("\nCompared with {0}\n".format(args.compare))
+        for case, size, ratio in ratios:
+            sys.stdout.write("{0:>26} {1:>8} {2:>8.2f}x\n".format(
+                case, size, ratio))
+
+
+if __name__ == "__main__":
+    main()
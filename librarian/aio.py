@@ -0,0 +1,140 @@
+"""An asyncio interface to a Library."""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+class AsyncLibrary(object):
+    """
+    Wraps a ``librarian.library.Library`` for use from asyncio coroutines
+    without blocking the event loop.
+
+    All database work is run on the given executor which defaults to a
+    single dedicated thread, and so a single connection to the database. The
+    card cache of the wrapped library is shared with any synchronous use of
+    it and is checked on the event loop so cached cards are returned without
+    waiting on the executor, unless the library has ``coherence`` enabled in
+    which case changes made by other connections are checked for on the
+    executor first.
+
+    Concurrent requests for the same uncached card are coalesced into a
+    single query whose result is shared by every request.
+
+    AsyncLibrary needs python 3.7 or later, unlike the rest of librarian.
+    """
+    def __init__(self, library, executor=None):
+        self.library = library
+        self.executor = executor if executor is not None else \
+            ThreadPoolExecutor(max_workers=1)
+        self._pending = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Call the given function with the given arguments on the executor and
+        return its result.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(func, *args, **kwargs))
+
+    async def close(self):
+        """Shut down the executor and close the library's connections."""
+        await self.run(self.library.close)
+        self.executor.shutdown(wait=False)
+
+    def _fetch(self, keys):
+        """
+        Return a future for each of the given card code keys, starting one
+        query for all of the keys that are not already being fetched.
+        """
+        loop = asyncio.get_running_loop()
+        futures = {}
+        missing = []
+        for key in keys:
+            if key in self._pending:
+                futures[key] = self._pending[key]
+            elif key not in futures:
+                futures[key] = self._pending[key] = loop.create_future()
+                missing.append(key)
+
+        if missing:
+            query = loop.run_in_executor(
+                self.executor, self.library._select_cards, missing)
+            query.add_done_callback(partial(self._fetched, missing))
+        return futures
+
+    def _fetched(self, keys, query):
+        """Resolve the pending futures of the given keys with a query."""
+        for key in keys:
+            future = self._pending.pop(key)
+            if future.done():
+                continue
+            if query.cancelled():
+                future.cancel()
+            elif query.exception() is not None:
+                future.set_exception(query.exception())
+            else:
+                future.set_result(query.result().get(key))
+
+    async def _check_changes(self):
+        """
+        Forget the cards changed by other connections, on the executor, if
+        the wrapped library has ``coherence`` enabled.
+        """
+        if self.library.coherence is not None:
+            await self.run(self.library._check_changes)
+
+    async def load_card(self, code, cache=True):
+        """Load a card like ``Library.load_card`` without blocking."""
+        await self._check_changes()
+        card = self.library.card_cache.get(code, None)
+        if card is None:
+            key = str(code)
+            card = await asyncio.shield(self._fetch((key,))[key])
+            if card is not None and cache:
+                self.library.cache_card(card)
+        return card
+
+    async def load_cards(self, codes, cache=True):
+        """Load cards like ``Library.load_cards`` without blocking."""
+        codes = list(codes)
+        await self._check_changes()
+        found = {}
+        for code in codes:
+            key = str(code)
+            if key not in found:
+                found[key] = self.library.card_cache.get(code, None)
+
+        futures = self._fetch([key for key, card in found.items()
+                               if card is None])
+        if futures:
+            cards = await asyncio.shield(asyncio.gather(*futures.values()))
+            for key, card in zip(futures, cards):
+                found[key] = card
+                if card is not None and cache:
+                    self.library.cache_card(card)
+        return [found[str(code)] for code in codes]
+
+    async def save_card(self, card, cache=False):
+        """Save a card like ``Library.save_card`` without blocking."""
+        await self.run(self.library.save_card, card, cache)
+
+    async def save_cards(self, cards, cache=False):
+        """Save cards like ``Library.save_cards`` without blocking."""
+        await self.run(self.library.save_cards, list(cards), cache)
+
+    async def filter_search(self, **kwargs):
+        """Search like ``Library.filter_search`` without blocking."""
+        return await self.run(self.library.filter_search, **kwargs)
+
+    async def text_search(self, query, limit=10):
+        """Search like ``Library.text_search`` without blocking."""
+        return await self.run(self.library.text_search, query, limit)
@@ -0,0 +1,205 @@
+"""A least recently used cache for card objects."""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_size(obj):
+    """
+    Return a rough estimate, in bytes, of the memory used by the given object
+    and any lists, tuples, sets or dicts it contains.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key) + estimate_size(value)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for elem in obj:
+            size += estimate_size(elem)
+    return size
+
+
+def estimate_card_size(card):
+    """
+    Return a rough estimate, in bytes, of the memory used by a card.
+
+    The fields of a lazy card, see ``librarian.card.LazyCard``, that have not
+    been decoded are estimated from their stored data so they stay encoded.
+    A ``Library`` sizes its cached lazy cards again as each field decodes,
+    see ``CardCache.resize``.
+    """
+    if not getattr(card, "lazy", False):
+        return sys.getsizeof(card) + estimate_size(card.save())
+    encoded = card._encoded
+    size = sys.getsizeof(card) + estimate_size(card.code) + \
+        estimate_size(card.name)
+    for field in ("abilities", "attributes", "info"):
+        size += estimate_size(encoded[field] if field in encoded
+                              else getattr(card, field))
+    return size
+
+
+class CardCache(object):
+    """
+    Stores cards by their code and discards the least recently used card when
+    more then ``limit`` cards are stored or, if ``maxsize`` is given, when the
+    estimated size of all stored cards exceeds ``maxsize`` bytes. Codes are
+    stored and looked up by their ``str()``, as by the rest of the library,
+    so ``1`` and ``"1"`` find the same card.
+
+    The size of each card is estimated with the ``sizer`` function which
+    defaults to ``estimate_card_size`` and is only called when a ``maxsize``
+    has been given.
+
+    Every lookup with ``CardCache.get`` is counted as either a hit or a miss
+    and each card discarded to make room is counted as an eviction. These
+    counters can be read from ``CardCache.stats``.
+
+    All operations are O(1) and safe to use from multiple threads.
+    """
+    def __init__(self, limit=100, maxsize=None, sizer=estimate_card_size):
+        self.limit = limit
+        self.maxsize = maxsize
+        self.sizer = sizer
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cards = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._cards)
+
+    def __contains__(self, code):
+        return str(code) in self._cards
+
+    def get(self, code, default=None):
+        """
+        Return the card stored under the given code, marking it as the most
+        recently used, or default if there is no such card.
+        """
+        code = str(code)
+        with self._lock:
+            card = self._cards.pop(code, None)
+            if card is None:
+                self.misses += 1
+                return default
+            self._cards[code] = card
+            self.hits += 1
+            return card
+
+    def put(self, card):
+        """
+        Store the given card as the most recently used card, evicting the least
+        recently used cards until the cache is within its limits.
+        """
+        code = str(card.code)
+        with self._lock:
+            self._discard(code)
+            self._cards[code] = card
+            if self.maxsize is not None:
+                cardsize = self.sizer(card)
+                self._sizes[code] = cardsize
+                self.size += cardsize
+            while self._cards and (len(self._cards) > self.limit or (
+                    self.maxsize is not None and self.size > self.maxsize)):
+                self._discard(next(iter(self._cards)))
+                self.evictions += 1
+
+    def resize(self, card):
+        """
+        Estimate the size of the given card again, if it is cached and a
+        ``maxsize`` has been given, such as when a lazy card decodes a field,
+        evicting the least recently used cards until the cache is within its
+        limits.
+        """
+        if self.maxsize is None:
+            return
+        code = str(card.code)
+        with self._lock:
+            if self._cards.get(code) is not card:
+                return
+            cardsize = self.sizer(card)
+            self.size += cardsize - self._sizes.get(code, 0)
+            self._sizes[code] = cardsize
+            while self._cards and self.size > self.maxsize:
+                self._discard(next(iter(self._cards)))
+                self.evictions += 1
+
+    def discard(self, code):
+        """Remove the card with the given code if it is cached."""
+        with self._lock:
+            self._discard(str(code))
+
+    def _discard(self, code):
+        """Remove the ``str()`` of a code without acquiring the lock."""
+        if self._cards.pop(code, None) is not None:
+            self.size -= self._sizes.pop(code, 0)
+
+    def clear(self):
+        """Remove every card from the cache, leaving the counters intact."""
+        with self._lock:
+            self._cards.clear()
+            self._sizes.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Return a dict of the number of cards cached, their estimated size, and
+        the hit, miss and eviction counters along with the hit ratio.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(cards=len(self._cards), size=self.size,
+                        hits=self.hits, misses=self.misses,
+                        evictions=self.evictions,
+                        ratio=float(self.hits) / lookups if lookups else 0.0)
+
+
+class NegativeCache(object):
+    """
+    Remembers the codes of cards that could not be found for ``ttl`` seconds
+    so repeated lookups of missing cards need not query the database. At
+    most ``limit`` codes are remembered, forgetting the oldest first.
+    """
+    def __init__(self, ttl=60, limit=10000, clock=time.time):
+        self.ttl = ttl
+        self.limit = limit
+        self.clock = clock
+        self._codes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __contains__(self, code):
+        expires = self._codes.get(code)
+        if expires is None:
+            return False
+        if expires <= self.clock():
+            self.discard(code)
+            return False
+        return True
+
+    def add(self, code):
+        """Remember that the card with the given code could not be found."""
+        with self._lock:
+            self._codes.pop(code, None)
+            self._codes[code] = self.clock() + self.ttl
+            while len(self._codes) > self.limit:
+                self._codes.popitem(last=False)
+
+    def discard(self, code):
+        """Forget the given code, such as when a card is saved with it."""
+        with self._lock:
+            self._codes.pop(code, None)
+
+    def clear(self):
+        """Forget every code."""
+        with self._lock:
+            self._codes.clear()
@@ -2,34 +2,17 @@
 __author__ = 'Taylor "Nekroze" Lawson'
 __email__ = 'nekroze@eturnilnetwork.com'
 from six import text_type
+from six.moves import intern
+from .codec import literal_decode
 
 
-class Card(object):
+class BaseCard(object):
     """
-    The card stores general information about the card.
-     * code: the unique identifier for this card.
-     * name: name of this card to be displayed.
-     * abilities: dict of phase ids containing a list of action descriptors.
-     * attributes: list of special details this card has.
-     * info: dict of any information you would like.
-
-    Card can be saved to, and loaded from, a string. Call ``str()`` on a Card
-    instance or ``.save_string()`` on the instance. This will return a string
-    that when evaluated using ``eval()`` can be unpacked into the Card
-    constructor re-create that card. For example.
-    ``original = Card(1, 'cool card')``
-    ``savestring = str(card)``
-    ``loaded = Card(*eval(savestring))``
-    ``assert loaded == original``
+    The methods shared by every kind of card, see ``Card``. BaseCard stores
+    nothing itself, its ``__slots__`` are empty, so a subclass that declares
+    ``__slots__`` has no ``__dict__``.
     """
-    def __init__(self, code=None, name=None, loaddict=None):
-        self.code = 0 if code is None else code
-        self.name = '' if name is None else name
-        self.abilities = {}
-        self.attributes = []
-        self.info = {}
-        if loaddict is not None:
-            self.load(loaddict)
+    __slots__ = ()
 
     def is_valid(self):
         """Returns True if code is not 0 and self.name is not ''."""
@@ -89,31 +72,42 @@ class Card(object):
         """
         Takes a carddict as produced by ``Card.save`` and sets this card
         instances information to the previously saved cards information.
+
+        Any of the abilities, attributes and info values may also be given as
+        a string produced by ``str()`` which will be decoded with
+        ``ast.literal_eval``.
         """
         self.code = carddict["code"]
         if isinstance(self.code, text_type):
-            self.code = eval(self.code)
+            try:
+                self.code = literal_decode(self.code)
+            except (ValueError, SyntaxError):
+                pass
         self.name = carddict["name"]
         self.abilities = carddict["abilities"]
         if isinstance(self.abilities, text_type):
-            self.abilities = eval(self.abilities)
+            self.abilities = literal_decode(self.abilities)
         self.attributes = carddict["attributes"]
         if isinstance(self.attributes, text_type):
-            self.attributes = eval(self.attributes)
+            self.attributes = literal_decode(self.attributes)
         self.info = carddict["info"]
         if isinstance(self.info, text_type):
-            self.info = eval(self.info)
+            self.info = literal_decode(self.info)
         return self
 
     def __eq__(self, other):
         """Return True if this card's code is the same as the other's code."""
-        return isinstance(other, Card) and self.code == other.code
+        return isinstance(other, BaseCard) and self.code == other.code
+
+    def __hash__(self):
+        """Return a hash of this card's code, consistent with ``__eq__``."""
+        return hash(self.code)
 
     def __neq__(self, other):
         """
         Return True if this card's code is not the same as the other's code.
         """
-        return isinstance(other, Card) and self.code != other.code
+        return isinstance(other, BaseCard) and self.code != other.code
 
     def __str__(self):
         """
@@ -132,3 +126,210 @@ class Card(object):
         is replaced with the code for the card instance.
         """
         return "<Card:{0}>".format(str(self.code))
+
+
+class Card(BaseCard):
+    """
+    The card stores general information about the card.
+     * code: the unique identifier for this card.
+     * name: name of this card to be displayed.
+     * abilities: dict of phase ids containing a list of action descriptors.
+     * attributes: list of special details this card has.
+     * info: dict of any information you would like.
+
+    Card can be saved to, and loaded from, a string. Call ``str()`` on a Card
+    instance. This will return a string that when evaluated using
+    ``ast.literal_eval()`` gives a carddict that can be passed to the Card
+    constructor to re-create that card. For example.
+    ``original = Card(1, 'cool card')``
+    ``savestring = str(original)``
+    ``loaded = Card(loaddict=ast.literal_eval(savestring))``
+    ``assert loaded == original``
+    """
+    def __init__(self, code=None, name=None, loaddict=None):
+        self.code = 0 if code is None else code
+        self.name = '' if name is None else name
+        self.abilities = {}
+        self.attributes = []
+        self.info = {}
+        if loaddict is not None:
+            self.load(loaddict)
+
+
+_attribute_sets = {}
+
+
+def _intern(value):
+    """
+    Return the interned copy of the given value if it is a string, so equal
+    strings share memory, otherwise return the value.
+    """
+    return intern(value) if isinstance(value, str) else value
+
+
+def _intern_attributes(attributes):
+    """
+    Return a frozenset of the given attributes shared with every other card
+    that has the same attributes.
+    """
+    attributes = frozenset(_intern(attribute) for attribute in attributes)
+    return _attribute_sets.setdefault(attributes, attributes)
+
+
+class CompactCard(BaseCard):
+    """
+    A card with the methods of ``Card`` that uses as little memory as
+    possible, for keeping very many cards loaded at once, and can be used as
+    a ``Library`` cardclass.
+
+    CompactCard is based on ``BaseCard`` rather then ``Card`` so it has no
+    ``__dict__``, setting any other field raises an ``AttributeError``, and
+    it is not an instance of ``Card``. It stores its fields in ``__slots__``
+    and interns the strings used for its name, attributes, ability phases
+    and abilities and info keys. Attributes are stored as a frozenset, shared
+    by every card with the same attributes, so ``has_attribute`` takes
+    constant time however many attributes a card has. As a set attributes
+    have no order or duplicates and ``add_attribute`` returns the number of
+    distinct attributes.
+
+    The abilities of each phase are stored in a tuple and info values that
+    are lists are appended to as normal.
+    """
+    __slots__ = ("code", "name", "abilities", "attributes", "info")
+
+    def __init__(self, code=None, name=None, loaddict=None):
+        self.code = 0 if code is None else code
+        self.name = _intern('' if name is None else name)
+        self.abilities = {}
+        self.attributes = _intern_attributes(())
+        self.info = {}
+        if loaddict is not None:
+            self.load(loaddict)
+
+    def add_attribute(self, attribute):
+        """
+        Add the given attribute to this Card. Returns the number of distinct
+        attributes after addition.
+        """
+        self.attributes = _intern_attributes(
+            self.attributes.union((attribute,)))
+        return len(self.attributes)
+
+    def add_ability(self, phase, ability):
+        """Add the given ability to this Card under the given phase. Returns
+        the length of the abilities for the given phase after the addition.
+        """
+        phase = _intern(phase)
+        abilities = self.abilities.get(phase, ()) + (_intern(ability),)
+        self.abilities[phase] = abilities
+        return len(abilities)
+
+    def set_info(self, key, value, append=True):
+        """
+        Set any special info you wish to the given key, see ``Card.set_info``.
+        """
+        BaseCard.set_info(self, _intern(key), _intern(value), append)
+
+    def save(self):
+        """
+        Converts the Card as is into a dictionary capable of reconstructing the
+        card with ``Card.load`` or serialized to a string for storage. The
+        attributes are saved as a list sorted by their string form.
+        """
+        return dict(code=self.code, name=self.name,
+                    abilities=dict((phase, list(abilities))
+                                   for phase, abilities
+                                   in self.abilities.items()),
+                    attributes=sorted(self.attributes, key=str),
+                    info=self.info)
+
+    def load(self, carddict):
+        """
+        Takes a carddict as produced by ``Card.save`` and sets this card
+        instances information to the previously saved cards information.
+        """
+        BaseCard.load(self, carddict)
+        self.name = _intern(self.name)
+        self.abilities = dict(
+            (_intern(phase), tuple(_intern(ability) for ability in abilities)
+             if isinstance(abilities, (list, tuple)) else _intern(abilities))
+            for phase, abilities in self.abilities.items())
+        self.attributes = _intern_attributes(self.attributes)
+        self.info = dict(
+            (_intern(key), [_intern(elem) for elem in value]
+             if isinstance(value, list) else _intern(value))
+            for key, value in self.info.items())
+        return self
+
+    def __repr__(self):
+        """
+        Called by ``repr(MyCard)``. Returns the string '<CompactCard:#>' where
+        '#' is replaced with the code for the card instance.
+        """
+        return "<CompactCard:{0}>".format(str(self.code))
+
+
+_missing = object()
+
+
+def _lazy_field(field):
+    """
+    Return a property for a field of a ``LazyCard`` that is decoded from its
+    stored data the first time it is used.
+    """
+    private = "_" + field
+
+    def get(self):
+        data = self._encoded.get(field, _missing)
+        if data is not _missing:
+            setattr(self, private, self._decode(field, data))
+            self._encoded.pop(field, None)
+            if self._on_decode is not None:
+                self._on_decode(self)
+        return getattr(self, private)
+
+    def set(self, value):
+        self._encoded.pop(field, None)
+        setattr(self, private, value)
+    return property(get, set, doc="The {0} of this card.".format(field))
+
+
+class LazyCard(Card):
+    """
+    A ``Card`` whose abilities, attributes and info are only decoded the first
+    time each of them is used, for listing many cards by code and name
+    without paying to decode the rest. Used as a ``Library`` cardclass the
+    library creates lazy cards from the stored data of each field.
+
+    A lazy card is given the ``encoded`` data of each field by its name and
+    the ``decode`` function called with the name and data of a field to
+    decode it. Setting a field replaces its data. The decode function is kept
+    until every field is decoded so lazy cards can not be pickled. If
+    ``on_decode`` is given it is called with the card after each field is
+    decoded.
+    """
+    lazy = True
+
+    def __init__(self, code=None, name=None, loaddict=None, encoded=None,
+                 decode=None, on_decode=None):
+        self._encoded = {}
+        self._on_decode = on_decode
+        Card.__init__(self, code, name, loaddict)
+        if encoded:
+            self._decode = decode
+            self._encoded.update(encoded)
+
+    abilities = _lazy_field("abilities")
+    attributes = _lazy_field("attributes")
+    info = _lazy_field("info")
+
+    def decoded(self):
+        """Return True if every field of this card has been decoded."""
+        return not self._encoded
+
+    def __repr__(self):
+        """
+        Called by ``repr(MyCard)``. Returns the string '<LazyCard:#>' where '#'
+        is replaced with the code for the card instance.
+        """
+        return "<LazyCard:{0}>".format(str(self.code))
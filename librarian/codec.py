@@ -0,0 +1,157 @@
+"""Codecs used to serialize card fields for storage."""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+import ast
+import json
+from six import binary_type, string_types, text_type
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+ITEMS_KEY = "__items__"
+CONTAINERS = (dict, list, tuple)
+
+
+def literal_decode(data):
+    """
+    Decode data stored by ``str()`` in older versions of librarian. Unlike the
+    ``eval()`` that was previously used this will only ever construct python
+    literals.
+    """
+    return ast.literal_eval(data)
+
+
+class Codec(object):
+    """
+    A codec converts card field values to and from a storable form. Every
+    encoded value is prefixed with the codec's ``tag`` and a ``:`` which act
+    as the format version marker used by ``decode`` to find the codec to
+    decode it with.
+
+    Subclasses should set a unique ``tag`` and implement ``dumps`` and
+    ``loads``. Codecs are registered for decoding with ``register``.
+    """
+    tag = None
+
+    def dumps(self, value):
+        """Convert the given value to text or bytes without a tag."""
+        raise NotImplementedError()
+
+    def loads(self, data):
+        """Convert untagged data produced by ``dumps`` back into a value."""
+        raise NotImplementedError()
+
+    def encode(self, value):
+        """Convert the given value into tagged text or bytes."""
+        data = self.dumps(value)
+        if isinstance(data, binary_type):
+            return self.tag.encode("ascii") + b":" + data
+        return self.tag + ":" + data
+
+    def decode(self, data):
+        """Convert tagged data produced by ``encode`` back into a value."""
+        return self.loads(data[len(self.tag) + 1:])
+
+
+class JSONCodec(Codec):
+    """
+    Stores values as JSON text. Dicts with keys that are not strings, such as
+    integer phase ids, are stored as a list of key and value pairs so they
+    load back unchanged.
+    """
+    tag = "j1"
+
+    def dumps(self, value):
+        return json.dumps(self._pack(value), separators=(",", ":"))
+
+    def loads(self, data):
+        return json.loads(data, object_hook=self._unpack)
+
+    def _pack(self, value):
+        """
+        Convert a value into one that JSON can store without loss. Lists and
+        dicts that hold no other lists or dicts are returned as is.
+        """
+        if isinstance(value, dict):
+            if all(isinstance(key, string_types) for key in value):
+                if not any(isinstance(elem, CONTAINERS)
+                           for elem in value.values()):
+                    return value
+                return dict((key, self._pack(elem))
+                            for key, elem in value.items())
+            return {ITEMS_KEY: [[self._pack(key), self._pack(elem)]
+                                for key, elem in value.items()]}
+        elif isinstance(value, (list, tuple)):
+            if not any(isinstance(elem, CONTAINERS) for elem in value):
+                return value
+            return [self._pack(elem) for elem in value]
+        return value
+
+    def _unpack(self, value):
+        """Restore a dict that ``_pack`` stored as key and value pairs."""
+        if len(value) == 1 and ITEMS_KEY in value:
+            return dict((tuple(key) if isinstance(key, list) else key, elem)
+                        for key, elem in value[ITEMS_KEY])
+        return value
+
+
+class MsgpackCodec(Codec):
+    """
+    Stores values in the compact MessagePack binary format. Requires the
+    optional ``msgpack`` package.
+    """
+    tag = "m1"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("MsgpackCodec requires the msgpack package")
+
+    def dumps(self, value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data):
+        return msgpack.unpackb(data, raw=False, strict_map_key=False,
+                               use_list=True)
+
+
+CODECS = {}
+
+
+def register(codec):
+    """Register a codec instance so ``decode`` can read data it encoded."""
+    CODECS[codec.tag] = codec
+    return codec
+
+
+def lookup(data):
+    """
+    Return the registered codec that encoded the given data or None if the
+    data has no known tag, such as legacy ``str()`` encoded data.
+    """
+    if isinstance(data, binary_type):
+        tag, sep, _ = data[:8].partition(b":")
+        tag = tag.decode("ascii", "replace")
+    elif isinstance(data, text_type):
+        tag, sep, _ = data[:8].partition(":")
+    else:
+        return None
+    return CODECS.get(tag) if sep else None
+
+
+def decode(data):
+    """
+    Decode the given data with the codec that encoded it, falling back to
+    ``literal_decode`` for legacy data without a tag.
+    """
+    codec = lookup(data)
+    if codec is not None:
+        return codec.decode(data)
+    return literal_decode(data)
+
+
+register(JSONCodec())
+if msgpack is not None:
+    register(MsgpackCodec())
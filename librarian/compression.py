@@ -0,0 +1,94 @@
+"""Compression of stored card fields through the hooks of a Library."""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+import zlib
+from six import binary_type, text_type
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+
+# The prefix of data compressed with each algorithm, followed by a ``t`` if
+# the data was text or a ``b`` if it was bytes.
+MAGIC = {"zlib": b"zlib1:", "lzma": b"lzma1:"}
+MAGIC_SIZE = 6
+THRESHOLDS = {"abilities": 256, "info": 256}
+
+
+def _decompressors():
+    """Return the function decompressing data for each magic prefix."""
+    decompressors = {MAGIC["zlib"]: zlib.decompress}
+    if lzma is not None:
+        decompressors[MAGIC["lzma"]] = lzma.decompress
+    return decompressors
+
+
+DECOMPRESSORS = _decompressors()
+
+
+def decompress(field, data):
+    """
+    A load hook that restores data compressed by any ``Compressor`` and
+    returns all other data as is.
+    """
+    if not isinstance(data, binary_type):
+        return data
+    decompressor = DECOMPRESSORS.get(data[:MAGIC_SIZE])
+    if decompressor is None:
+        return data
+    raw = decompressor(data[MAGIC_SIZE + 1:])
+    if data[MAGIC_SIZE:MAGIC_SIZE + 1] == b"t":
+        return raw.decode("utf-8")
+    return raw
+
+
+class Compressor(object):
+    """
+    A save hook that compresses the encoded data of each field listed in
+    ``thresholds`` once it is at least the given number of bytes long, by
+    default the abilities and info of a card at 256 bytes or more. Data that
+    would not get smaller is stored as is.
+
+    The ``algorithm`` may be ``"zlib"`` or, if python has the ``lzma``
+    module, ``"lzma"`` which is slower but compresses further. The ``level``
+    is passed to zlib or used as the lzma preset.
+
+    Compressed data is stored as bytes that begin with one of the ``MAGIC``
+    prefixes so ``decompress`` can restore it whichever algorithm was used.
+    """
+    def __init__(self, algorithm="zlib", thresholds=None, level=None):
+        if algorithm not in MAGIC:
+            raise ValueError("Unknown compression algorithm {0}".format(
+                algorithm))
+        if algorithm == "lzma" and lzma is None:
+            raise ImportError("lzma compression requires the lzma module")
+        self.algorithm = algorithm
+        self.thresholds = dict(thresholds if thresholds is not None
+                               else THRESHOLDS)
+        self.level = level
+        self.magic = MAGIC[algorithm]
+
+    def _compress(self, raw):
+        """Compress bytes with the chosen algorithm."""
+        if self.algorithm == "lzma":
+            return lzma.compress(raw, preset=self.level)
+        return zlib.compress(raw, self.level if self.level is not None
+                             else zlib.Z_DEFAULT_COMPRESSION)
+
+    def compress(self, field, data):
+        """Return the compressed data of a field or the data as is."""
+        threshold = self.thresholds.get(field)
+        if threshold is None:
+            return data
+        text = isinstance(data, text_type)
+        raw = data.encode("utf-8") if text else data
+        if len(raw) < threshold:
+            return data
+        packed = self.magic + (b"t" if text else b"b") + self._compress(raw)
+        return packed if len(packed) < len(raw) else data
+
+    def decompress(self, field, data):
+        """Restore compressed data, see ``decompress``."""
+        return decompress(field, data)
@@ -2,14 +2,46 @@
 __author__ = 'Taylor "Nekroze" Lawson'
 __email__ = 'nekroze@eturnilnetwork.com'
 import random
-from functools import partial
+from array import array
+from . import simulate
+
+
+# The array typecode of card codes in a compact deck, 64 bit integers or the
+# C long on python 2 which has no 64 bit typecode.
+try:
+    CODE_TYPECODE = array("q").typecode
+except ValueError:
+    CODE_TYPECODE = "l"
 
 
 class Deck(object):
-    """A collection of possibly recuring cards stored as codes."""
-    def __init__(self, library=None, cards=None):
+    """
+    A collection of possibly recuring cards stored as codes. The top of the
+    deck is the end of the ``cards`` sequence.
+
+    If compact is True the codes, which must then be integers, are stored in
+    a typed ``array.array`` rather then a list which uses a fraction of the
+    memory.
+
+    The deck is shuffled using the given rng, an object providing a
+    ``shuffle`` method such as a seeded ``random.Random`` instance. If no rng
+    is given the ``random`` module is used.
+    """
+    __slots__ = ("library", "cards", "rng")
+
+    def __init__(self, library=None, cards=None, compact=False, rng=None):
         self.library = library
-        self.cards = cards if cards is not None else []
+        if compact:
+            self.cards = array(CODE_TYPECODE,
+                               cards if cards is not None else ())
+        else:
+            self.cards = cards if cards is not None else []
+        self.rng = rng if rng is not None else random
+
+    @property
+    def compact(self):
+        """True if the cards of this deck are stored in a typed array."""
+        return isinstance(self.cards, array)
 
     def remaining(self):
         """Returns the number of remaining cards in the deck."""
@@ -17,7 +49,7 @@ class Deck(object):
 
     def shuffle(self):
         """Sort the cards in the deck into a random order.."""
-        self.cards = random.shuffle(self.cards)
+        self.rng.shuffle(self.cards)
 
     def get_card(self, index=-1, cache=True, remove=True):
         """
@@ -33,7 +65,7 @@ class Deck(object):
         If remove is true then the card will be removed from the deck before
         returning it.
         """
-        if len(self.cards) < index:
+        if not -len(self.cards) <= index < len(self.cards):
             return None
 
         retriever = self.cards.pop if remove else self.cards.__getitem__
@@ -47,19 +79,49 @@ class Deck(object):
     def top_cards(self, number=1, cache=True, remove=True):
         """
         Retrieve the top number of cards as ``Librarian.Card`` objects in a
-        list in order of top to bottom most card. Uses the decks
-        ``.get_card`` and passes along the cache and remove arguments.
+        list in order of top to bottom most card. All of the cards are loaded
+        from the library at once, passing along the cache argument.
+
+        If remove is true then the cards will be removed from the deck before
+        returning them.
+        """
+        split = max(len(self.cards) - number, 0)
+        codes = self.cards[split:][::-1]
+        if remove:
+            del self.cards[split:]
+
+        if self.library:
+            return self.library.load_cards(codes, cache)
+        else:
+            return list(codes)
+
+    def peek(self, number=1):
+        """
+        Return the codes of the top `number` of cards, in order of top to
+        bottom most card, without removing them. For a compact deck this is a
+        ``memoryview`` of the deck which does not copy the codes and should
+        not be kept while the deck is changed, or a copy of the codes on
+        python 2 where arrays do not support ``memoryview``.
         """
-        getter = partial(self.get_card(cache=cache, remove=remove))
-        return [getter(index=i) for i in range(number)]
+        split = max(len(self.cards) - number, 0)
+        if self.compact:
+            try:
+                return memoryview(self.cards)[split:][::-1]
+            except TypeError:
+                pass
+        return self.cards[split:][::-1]
 
     def move_top_cards(self, other, number=1):
         """
-        Move the top `number` of cards to the top of some `other` deck.
+        Move the top `number` of cards to the top of some `other` deck, one
+        card at a time, so the top card of this deck ends up below the others
+        that were moved.
 
         By default only one card will be moved if `number` is not specified.
         """
-        other.cards.append(reversed(self.cards[-number:]))
+        split = max(len(self.cards) - number, 0)
+        other.cards.extend(self.cards[split:][::-1])
+        del self.cards[split:]
 
     def contains_card(self, code):
         """Returns true if the given code is currently stored in this deck."""
@@ -70,18 +132,41 @@ class Deck(object):
         Returns how many cards in the deck have the specified attribute.
 
         This method requires a library to be stored in the deck instance and
-        will return `None` if there is no library.
+        will return `0` if there is no library. The cards are not loaded,
+        instead the library's card index is used.
         """
         if self.library is None:
             return 0
 
-        load = self.library.load_card
-        matches = 0
+        codes = self.library.card_index().attribute_codes(attribute)
+        return sum(1 for code in self.cards if str(code) in codes)
+
+    def attribute_histogram(self, attributes=None):
+        """
+        Returns a dict of how many cards in the deck have each of the given
+        attributes, or every attribute of any card in the deck if attributes
+        is not given, counted in a single pass over the deck.
+
+        This method requires a library to be stored in the deck instance and
+        will return an empty dict if there is no library.
+        """
+        if self.library is None:
+            return {}
+
+        card_attributes = self.library.card_index().card_attributes
+        if attributes is None:
+            histogram = {}
+            for code in self.cards:
+                for attribute in card_attributes.get(str(code), ()):
+                    histogram[attribute] = histogram.get(attribute, 0) + 1
+            return histogram
+
+        histogram = dict((attribute, 0) for attribute in attributes)
         for code in self.cards:
-            card = load(code)
-            if card.has_attribute(attribute):
-                matches += 1
-        return matches
+            for attribute in card_attributes.get(str(code), ()):
+                if attribute in histogram:
+                    histogram[attribute] += 1
+        return histogram
 
     def contains_info(self, key, value):
         """
@@ -89,15 +174,40 @@ class Deck(object):
         specified key in their info data.
 
         This method requires a library to be stored in the deck instance and
-        will return `None` if there is no library.
+        will return `0` if there is no library. The cards are not loaded,
+        instead the library's card index is used.
         """
         if self.library is None:
             return 0
 
-        load = self.library.load_card
-        matches = 0
-        for code in self.cards:
-            card = load(code)
-            if card.get_info(key) == value:
-                matches += 1
-        return matches
+        values = self.library.card_index().info_values(key)
+        return sum(1 for code in self.cards
+                   if values.get(str(code)) == value)
+
+    def simulate(self, trials, hand_size, predicate, seed=None,
+                 features=None, processes=None):
+        """
+        Estimate the probability of drawing a hand of hand_size cards from
+        this deck, once shuffled, that satisfies the given predicate by
+        simulating the given number of draws. See
+        ``librarian.simulate.simulate`` for the returned statistics and how
+        the seed and processes are used.
+
+        The predicate is called with a list of the features of each card in
+        the hand. If features is given it is called once for each distinct
+        card in the deck, with the card loaded from the library if there is
+        one or its code otherwise, and should return the value that will
+        represent that card. Without features the loaded cards, or codes, are
+        given to the predicate. Features should be small and picklable as
+        they are sent to each process running the simulation.
+        """
+        distinct = list(set(self.cards))
+        if self.library is not None:
+            cards = self.library.load_cards(distinct, cache=False)
+        else:
+            cards = distinct
+        values = [features(card) for card in cards] if features else cards
+        feature_of = dict(zip(distinct, values))
+        return simulate.simulate([feature_of[code] for code in self.cards],
+                                 trials, hand_size, predicate, seed=seed,
+                                 processes=processes)
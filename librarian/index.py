@@ -0,0 +1,79 @@
+"""An in memory inverted index of card attributes and info."""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+import threading
+
+
+class CardIndex(object):
+    """
+    Maps each attribute to the set of codes of the cards that have it, and
+    each info key to a dict of codes and the value stored under that key for
+    each card that has it.
+
+    The attributes of each card can also be found by its code so every
+    attribute of many cards can be counted in a single pass.
+
+    Codes are stored and looked up by their ``str()``, as by the rest of
+    the library, so ``1`` and ``"1"`` are the same card.
+    """
+    def __init__(self, cards=()):
+        self.attributes = {}
+        self.info = {}
+        self.card_attributes = {}
+        self._lock = threading.Lock()
+        for card in cards:
+            self.add(card)
+
+    def __len__(self):
+        return len(self.card_attributes)
+
+    def __contains__(self, code):
+        return str(code) in self.card_attributes
+
+    def add(self, card):
+        """
+        Add the attributes and info of the given card, which may be a card
+        object or a dict with code, attributes and info keys, replacing any
+        previously added for the same code.
+        """
+        if isinstance(card, dict):
+            code, attributes, info = (card["code"], card["attributes"],
+                                      card["info"])
+        else:
+            code, attributes, info = card.code, card.attributes, card.info
+        code = str(code)
+        with self._lock:
+            self._discard(code)
+            self.card_attributes[code] = attributes = tuple(attributes)
+            for attribute in attributes:
+                self.attributes.setdefault(attribute, set()).add(code)
+            for key, value in info.items():
+                self.info.setdefault(key, {})[code] = value
+
+    def discard(self, code):
+        """Remove everything added for the given code."""
+        with self._lock:
+            self._discard(str(code))
+
+    def _discard(self, code):
+        """Remove the ``str()`` of a code without acquiring the lock."""
+        for attribute in self.card_attributes.pop(code, ()):
+            codes = self.attributes.get(attribute)
+            if codes is not None:
+                codes.discard(code)
+        for values in self.info.values():
+            values.pop(code, None)
+
+    def attribute_codes(self, attribute):
+        """
+        Return the set of the ``str()`` of the codes of cards with the given
+        attribute.
+        """
+        return self.attributes.get(attribute, frozenset())
+
+    def info_values(self, key):
+        """
+        Return a dict of the ``str()`` of the codes of cards with the given
+        info key and the value each card stores under it.
+        """
+        return self.info.get(key, {})
@@ -1,178 +1,1243 @@
 """The Library class, an sqlite database of cards."""
 __author__ = 'Taylor "Nekroze" Lawson'
 __email__ = 'nekroze@eturnilnetwork.com'
+import json
 import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+from six import integer_types, string_types
+from . import schema, stream
+from .cache import CardCache, NegativeCache
 from .card import Card
+from .deck import Deck
+from .codec import JSONCodec, decode, lookup, register
+from .index import CardIndex
+from .membership import CodeSet
+from .metrics import Metrics
+from .pack import CardPack, write_pack
 
 
 FIELDS = ("code", "name", "abilities", "attributes", "info")
+ENCODED_FIELDS = ("abilities", "attributes", "info")
+CHUNK_SIZE = 500
+# Upserts were added in sqlite 3.24, older versions update the stored cards
+# and then insert the rest.
+UPSERT = sqlite3.sqlite_version_info >= (3, 24, 0)
+KEEP_CHANGES = 100000
+WAL_PRAGMAS = {"journal_mode": "WAL", "synchronous": "NORMAL",
+               "cache_size": -16384}
 
 
-def Where_filter_gen(*data):
+class ThreadConnection(object):
     """
-    Generate an sqlite "LIKE" filter generator based on the given data.
-    This functions arguments should be a N length series of field and data
-    tuples.
+    Holds the sqlite3 connection of a single thread. The connection is closed
+    when the holder is released, as happens to the thread local storage of a
+    thread when it exits, or when ``close`` is called.
     """
-    where = []
+    def __init__(self, carddb):
+        self.carddb = carddb
 
-    def Fwhere(field, pattern):
-        """Add where filter for the given field with the given pattern."""
-        where.append("WHERE {0} LIKE '{1}'".format(field, pattern))
+    def close(self):
+        """Close the connection."""
+        self.carddb.close()
 
-    def Fstring(field, string):
-        """Add a where filter based on a string."""
-        Fwhere(field, "%{0}%".format(string if not isinstance(string, str)
-                                     else str(string)))
+    def __del__(self):
+        self.close()
 
-    def Fdict(field, data):
-        """Add where filters to search for dict keys and values."""
-        for key, value in data.items():
-            if value == '*':
-                Fstring(field, key)
-            else:
-                Fstring(field, "{0}:%{1}".format(key, value if not
-                                                 isinstance(value, str)
-                                                 else str(value)))
 
-    def Flist(field, data):
-        """Add where filters to search for elements of a list."""
-        for elem in data:
-            Fstring(field, elem if not isinstance(elem, str) else
-                    str(elem))
+def index_value(value):
+    """
+    Convert a value to the form it is stored in the card index tables. Strings
+    and numbers are stored as is while any other value is stored as JSON.
+    """
+    if value is None or isinstance(value, (string_types, integer_types,
+                                           float)):
+        return value
+    return json.dumps(value, sort_keys=True)
+
+
+def index_elements(value):
+    """
+    Return the elements of a list, tuple or set value or the value alone,
+    converted with ``index_value``.
+    """
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [index_value(elem) for elem in value]
+    return [index_value(value)]
+
+
+def check_fields(fields):
+    """
+    Return the given field names as a tuple, raising a ValueError if any of
+    them are not in ``FIELDS``.
+    """
+    fields = tuple(fields)
+    unknown = set(fields).difference(FIELDS)
+    if unknown:
+        raise ValueError("Unknown fields: {0}".format(
+            ", ".join(sorted(unknown))))
+    return fields
+
+
+def project(fields, carddict):
+    """Return a dict of only the given fields of a carddict."""
+    return dict((key, carddict[key]) for key in fields)
+
+
+def Where_filter_gen(*data):
+    """
+    Generate an sqlite "WHERE" clause and its parameters based on the given
+    data. This functions arguments should be a N length series of field and
+    data tuples, any field whose data is None is ignored.
+
+    Returns a tuple of the clause, which is empty if there is nothing to
+    filter, and a list of parameters to execute it with.
+
+    Each field is filtered as follows:
+     * code: the code must be equal to the data.
+     * name: the name must contain the data.
+     * attributes: the card must have every attribute in the data list.
+     * abilities: the card must have every phase in the data dict and every
+       ability listed under it, or any ability if it is "*".
+     * info: the card must have every key in the data dict and every value
+       listed under it, or any value if it is "*".
+
+    Attributes, abilities and info are found through the CARD_ATTRIBUTES,
+    CARD_ABILITIES and CARD_INFO index tables.
+    """
+    where = []
+    params = []
+
+    def Fwhere(clause, *values):
+        """Add the where clause with the given parameter values."""
+        where.append(clause)
+        params.extend(values)
+
+    def Findex(table, column, key, value):
+        """Add a where clause matching codes found in an index table."""
+        if value == '*':
+            Fwhere("code IN (SELECT code FROM {0} WHERE {1} = ?)".format(
+                table, column), index_value(key))
+            return
+        for elem in index_elements(value):
+            Fwhere("code IN (SELECT code FROM {0} WHERE {1} = ? AND "
+                   "value = ?)".format(table, column), index_value(key),
+                   elem)
 
     for field, data in data:
-        if isinstance(data, str):
-            Fstring(field, data)
-        elif isinstance(data, dict):
-            Fdict(field, data)
-        elif isinstance(data, list):
-            Flist(field, data)
+        if data is None:
+            continue
+        elif field == "code":
+            Fwhere("code = ?", data)
+        elif field == "name":
+            Fwhere("name LIKE ? ESCAPE '\\'", "%{0}%".format(
+                data.replace("\\", "\\\\").replace("%", "\\%").replace(
+                    "_", "\\_")))
+        elif field == "attributes":
+            for elem in index_elements(data):
+                Fwhere("code IN (SELECT code FROM CARD_ATTRIBUTES WHERE "
+                       "attribute = ?)", elem)
+        elif field == "abilities":
+            for phase, abilities in data.items():
+                Findex("CARD_ABILITIES", "phase", phase, abilities)
+        elif field == "info":
+            for key, value in data.items():
+                Findex("CARD_INFO", "key", key, value)
 
-    return ' AND '.join(where)
+    return ("WHERE " + " AND ".join(where) if where else ""), params
 
 
 class Library(object):
     """
     Library wraps an sqlite3 database that stores serialized cards.
 
-    Library also allows load and save hooks that allow a list of function to be
-    called on each string as it is saved and loaded.
+    Library also allows load and save hooks, the ``load_chain`` and
+    ``save_chain`` lists of functions, that are called in order on the
+    encoded abilities, attributes and info of each card as it is loaded and
+    saved. Each hook is called with the field name and the encoded data and
+    returns the data to load or store, see ``Library.add_hooks`` and
+    ``librarian.compression.Compressor``.
 
     The ``Library`` constructor can take a ``cardclass`` argument which
     defaults to ``librarian.card.Card`` and is used to construct a card object
     when loading. A ``cardclass`` should be a subclass of
-    ``librarian.card.Card`` and be able to take the original ``carddict``
-    constructor argument alone along with providing the original or equal
-    ``Card.load`` and ``Card.save`` methods.
+    ``librarian.card.BaseCard``, such as ``librarian.card.Card``, and be able
+    to take the original ``carddict`` constructor argument alone along with
+    providing the original or equal ``Card.load`` and ``Card.save`` methods.
+    If the ``cardclass`` is, like ``librarian.card.LazyCard``, ``lazy`` it is
+    instead constructed from the code, name and stored data of each card and
+    decodes the rest as needed, being sized again in the cache as each field
+    is decoded if ``cachesize`` is given.
+
+    Loaded cards are kept in a ``librarian.cache.CardCache`` holding at most
+    ``cachelimit`` cards and, if ``cachesize`` is given, at most roughly
+    ``cachesize`` bytes worth of cards.
+
+    The abilities, attributes and info of each card are stored using the
+    ``codec`` argument, a ``librarian.codec.Codec`` which defaults to
+    ``librarian.codec.JSONCodec``. Cards stored with any registered codec, or
+    by older versions of librarian, can always be loaded and may be converted
+    to the current codec with ``Library.migrate_codec``.
+
+    If ``fulltext`` is True the name, abilities and the values of each info
+    key listed in ``fulltext_info`` of every card are kept in an sqlite FTS5
+    index that is searched by ``Library.text_search``.
+
+    If ``pack`` is given, as a path or a ``librarian.pack.CardPack``, the
+    library is a read only view of that card pack as written by
+    ``Library.export_pack``. Cards are loaded and iterated from the pack
+    without using a database and saving cards raises an error. Searches
+    still need a database.
+
+    If ``membership`` is True, or an object such as a
+    ``librarian.membership.BloomFilter`` that codes can be added to and
+    tested against with ``in``, the code of every card in the library is
+    recorded in it when first needed and as cards are saved. Codes it does
+    not contain are known to be missing and are not looked up at all. It is
+    rebuilt by filling the new, empty, object returned by its ``empty``
+    method which then replaces it, so other threads keep using the complete
+    one meanwhile, or by clearing it and filling it again if it has no
+    ``empty`` method. If
+    ``negative_ttl`` is given codes that could not be found are remembered,
+    and not looked up again, for that many seconds.
+
+    If ``metrics`` is True, or a ``librarian.metrics.Metrics``, the time
+    taken, rows produced and work done by sqlite in each operation of the
+    library is recorded, see ``Library.stats``, and slow operations may be
+    logged along with their SQL.
+
+    The code of every card saved by any connection is recorded in the
+    CARD_CHANGES table. If ``coherence`` is given, as a number of seconds,
+    lookups check for cards changed by other connections, such as other
+    processes, at most that often and drop only those cards from the cache,
+    card index and negative cache, see ``Library.refresh``. With a
+    ``coherence`` of 0 every lookup checks, which costs a ``PRAGMA
+    data_version`` query when nothing has changed. Whenever a save leaves
+    CARD_CHANGES holding twice ``keep_changes`` changes all but the last
+    ``keep_changes`` are deleted, so it does not grow without limit. With a
+    ``keep_changes`` of None the changes are only deleted by
+    ``Library.prune_changes``.
+
+    The database schema is versioned and any database created by an older
+    version of librarian is upgraded, see ``librarian.schema``, when the
+    library first connects to it.
+
+    Every save is made in a transaction of its own unless it is made within
+    ``Library.transaction``, which groups any number of saves into a single
+    commit.
+
+    If ``wal`` is True the database is opened in write ahead log mode, so
+    reads are not blocked while cards are being saved, with the pragmas in
+    ``WAL_PRAGMAS`` which sync to disk less often and give each connection
+    a 16MB page cache. Any other sqlite pragmas may be given as a dict of
+    names and values in ``pragmas``, these are set on every connection after
+    those of ``wal`` and so may override them.
+
+    Each thread that uses a ``Library`` is given its own long lived sqlite3
+    connection which is reused for every query made from that thread. A
+    connection is closed when its thread exits, so short lived threads do not
+    leave connections open, and every connection is closed by
+    ``Library.close`` or when a ``Library`` is used as a context manager and
+    the ``with`` block exits. As each thread has its
+    own connection an in memory database (``":memory:"``) will appear empty to
+    every thread but the one that created it.
     """
-    def __init__(self, dbname, cachelimit=100, cardclass=Card):
+    def __init__(self, dbname, cachelimit=100, cardclass=Card,
+                 cachesize=None, codec=None, fulltext=False,
+                 fulltext_info=(), pack=None, membership=None,
+                 negative_ttl=None, metrics=None, coherence=None, wal=False,
+                 pragmas=None, keep_changes=KEEP_CHANGES):
         self.dbname = dbname
+        self.pragmas = dict(WAL_PRAGMAS) if wal else {}
+        self.pragmas.update(pragmas or {})
+        self.pack = CardPack(pack) if isinstance(pack, string_types) \
+            else pack
+        self.fulltext = fulltext
+        self.fulltext_info = tuple(fulltext_info)
+        self.codec = register(codec if codec is not None else JSONCodec())
         self.save_chain = []
         self.load_chain = []
-        self.cachelimit = cachelimit
-        self.card_cache = {}
-        self.card_cache_list = []
+        self.card_cache = CardCache(cachelimit, cachesize)
         self.cardclass = cardclass
+        self._card_index = None
+        self.membership = CodeSet() if membership is True else membership
+        self._membership_loaded = False
+        self._membership_added = None
+        self._membership_lock = threading.Lock()
+        self._membership_rebuild = threading.RLock()
+        self.negative_cache = NegativeCache(negative_ttl) \
+            if negative_ttl is not None else None
+        self._local = threading.local()
+        self._connections = weakref.WeakValueDictionary()
+        self._connections_lock = threading.Lock()
+        self.coherence = coherence
+        self.keep_changes = keep_changes
+        self._change_id = None
+        self._checked = 0
+        self._changes_lock = threading.Lock()
+        self.metrics = Metrics() if metrics is True else metrics
+        if self.metrics is not None:
+            self.metrics.instrument(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _connect(self):
+        """
+        Open a new connection to the underlying database and set the
+        pragmas of this library on it.
+        """
+        carddb = sqlite3.connect(self.dbname, check_same_thread=False)
+        for name, value in sorted(self.pragmas.items()):
+            carddb.execute("PRAGMA {0} = {1}".format(name, value))
+        return carddb
+
+    def connection(self):
+        """
+        Return the connection to the underlying database for the calling
+        thread, opening it if this thread has not connected yet.
+        """
+        holder = getattr(self._local, "connection", None)
+        if holder is not None:
+            return holder.carddb
+        carddb = self._connect()
+        holder = ThreadConnection(carddb)
+        self._local.connection = holder
+        if self.metrics is not None:
+            self.metrics.attach(carddb)
+        with self._connections_lock:
+            self._connections[id(holder)] = holder
+        schema.upgrade(carddb, self)
+        if self._change_id is None:
+            with self._changes_lock:
+                if self._change_id is None:
+                    self._change_id = self._last_change(carddb)
+        if self.fulltext and not schema.table_exists(carddb, "CARDS_FTS"):
+            self.rebuild_fulltext()
+        return carddb
+
+    @contextmanager
+    def transaction(self):
+        """
+        A context manager that saves everything saved within it, by the
+        calling thread, in a single transaction which is committed when the
+        outermost ``with`` block exits or rolled back if it raises an
+        exception. Cards saved in a transaction that is rolled back are
+        forgotten by the cache and card index.
+
+        Transactions may be nested, only the outermost commits, and produce
+        the connection of the calling thread.
+        """
+        carddb = self.connection()
+        local = self._local
+        depth = getattr(local, "depth", 0)
+        if not depth:
+            carddb.execute("BEGIN IMMEDIATE")
+            local.saved = set()
+        local.depth = depth + 1
+        try:
+            yield carddb
+        except BaseException:
+            local.depth = depth
+            if not depth:
+                carddb.rollback()
+                self._forget(carddb, local.saved)
+            raise
+        local.depth = depth
+        if not depth:
+            carddb.commit()
+
+    def close(self):
+        """
+        Close every connection this library has opened. The library may still
+        be used afterwards and will simply reconnect as needed.
+        """
+        with self._connections_lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+            self._local = threading.local()
+        for holder in connections:
+            holder.close()
+
+    @property
+    def cachelimit(self):
+        """The maximum number of cards to keep in the card cache."""
+        return self.card_cache.limit
+
+    @cachelimit.setter
+    def cachelimit(self, limit):
+        self.card_cache.limit = limit
 
     def cached(self, code):
         """Return True if there is a card for the given code in the cache."""
-        return code in self.card_cache[code]
+        return code in self.card_cache
 
     def cache_card(self, card):
         """
-        Cache the card for faster future lookups. Removes the oldest card
-        when the card cache stores more cards then this libraries cache limit.
+        Cache the card for faster future lookups. Removes the least recently
+        used card when the card cache stores more cards then this libraries
+        cache limit.
+        """
+        self.card_cache.put(card)
+
+    def card_index(self):
+        """
+        Return a ``librarian.index.CardIndex`` of the attributes and info of
+        every card in the library. The index is built the first time it is
+        needed and kept up to date as cards are saved with this library.
+        """
+        if self.coherence is not None:
+            self._check_changes()
+        if self._card_index is None:
+            self._card_index = CardIndex(self.retrieve_all(
+                cache=False, fields=("code", "attributes", "info")))
+        return self._card_index
+
+    def rebuild_membership(self):
+        """
+        Record the code of every card in the library in a new ``membership``
+        which replaces the current one once it is complete. Codes of cards
+        saved while it is being built are added to it before it is used.
+        """
+        with self._membership_rebuild:
+            empty = getattr(self.membership, "empty", None)
+            with self._membership_lock:
+                self._membership_added = []
+                if empty is None:
+                    self._membership_loaded = False
+                    self.membership.clear()
+            membership = empty() if empty is not None else self.membership
+            if self.pack is not None:
+                codes = self.pack.codes()
+            else:
+                codes = (row[0] for row in self.connection().execute(
+                    "SELECT code FROM CARDS"))
+            for code in codes:
+                membership.add(str(code))
+            with self._membership_lock:
+                for key in self._membership_added:
+                    membership.add(key)
+                self._membership_added = None
+                self.membership = membership
+                self._membership_loaded = True
+
+    def _add_member(self, key):
+        """Record the ``str()`` of the code of a saved card in membership."""
+        with self._membership_lock:
+            if self._membership_loaded:
+                self.membership.add(key)
+            if self._membership_added is not None:
+                self._membership_added.append(key)
+
+    def _may_exist(self, key):
+        """
+        Return False if the card with the given ``str()`` of its code is known
+        not to exist without looking it up.
         """
-        code = card.code
-        self.card_cache[code] = card
-        if code in self.card_cache_list:
-            self.card_cache_list.remove(code)
-        self.card_cache_list.append(code)
+        if self.negative_cache is not None and key in self.negative_cache:
+            return False
+        if self.membership is not None:
+            if not self._membership_loaded:
+                with self._membership_rebuild:
+                    if not self._membership_loaded:
+                        self.rebuild_membership()
+            return key in self.membership
+        return True
+
+    @staticmethod
+    def _last_change(carddb):
+        """Return the id of the last change recorded in CARD_CHANGES."""
+        return carddb.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM CARD_CHANGES").fetchone()[0]
 
-        if len(self.card_cache_list) > self.cachelimit:
-            del self.card_cache[self.card_cache_list.pop(0)]
+    def _check_changes(self):
+        """Call ``Library.refresh`` if ``coherence`` seconds have passed."""
+        now = time.time()
+        if now - self._checked >= self.coherence:
+            self._checked = now
+            self.refresh()
+
+    def refresh(self):
+        """
+        Forget everything known about the cards that were changed by other
+        connections since the last refresh. Changed cards are dropped from the
+        cache and negative cache, and reloaded into the card index and
+        membership if they have been built.
+
+        Nothing is read from CARD_CHANGES unless the database was changed
+        by another connection, as told by ``PRAGMA data_version``. If the
+        changes were pruned before they could be read every cached card is
+        dropped instead.
+
+        Returns the number of changes found.
+        """
+        if self.pack is not None:
+            return 0
+        carddb = self.connection()
+        version = carddb.execute("PRAGMA data_version").fetchone()[0]
+        if version == getattr(self._local, "data_version", None):
+            return 0
+        self._local.data_version = version
+        with self._changes_lock:
+            changes = carddb.execute(
+                "SELECT id, code FROM CARD_CHANGES WHERE id > ? ORDER BY id",
+                (self._change_id,)).fetchall()
+            if not changes:
+                return 0
+            if changes[0][0] != self._change_id + 1:
+                self._forget_all()
+            else:
+                self._forget(carddb, set(code for _, code in changes))
+            self._change_id = changes[-1][0]
+        return len(changes)
+
+    def _forget(self, carddb, codes):
+        """Forget everything known about the cards with the given codes."""
+        for code in codes:
+            key = str(code)
+            self.card_cache.discard(key)
+            if self._card_index is not None:
+                self._card_index.discard(key)
+            if self.negative_cache is not None:
+                self.negative_cache.discard(key)
+            if self.membership is not None:
+                self._add_member(key)
+
+        if self._card_index is not None:
+            fields = ("code", "attributes", "info")
+            codes = list(codes)
+            for start in range(0, len(codes), CHUNK_SIZE):
+                chunk = codes[start:start + CHUNK_SIZE]
+                command = "SELECT {0} FROM CARDS WHERE code IN ({1})".format(
+                    ", ".join(fields), ", ".join("?" * len(chunk)))
+                for row in carddb.execute(command, chunk):
+                    self._card_index.add(self._row_dict(fields, row))
+
+    def _forget_all(self):
+        """Forget everything known about every card."""
+        self.card_cache.clear()
+        self._card_index = None
+        self._membership_loaded = False
+        if self.negative_cache is not None:
+            self.negative_cache.clear()
+
+    def prune_changes(self, keep=10000):
+        """
+        Delete all but the last ``keep`` changes from CARD_CHANGES. Libraries
+        that have not yet read the deleted changes drop their whole cache
+        when they next refresh.
+        """
+        with self.transaction() as carddb:
+            carddb.execute("DELETE FROM CARD_CHANGES WHERE id <= "
+                           "(SELECT MAX(id) FROM CARD_CHANGES) - ?", (keep,))
+
+    @staticmethod
+    def _trim_changes(carddb, keep):
+        """
+        Delete all but the last ``keep`` changes from CARD_CHANGES if it holds
+        at least twice that many, so it is not trimmed on every save.
+        """
+        first, last = carddb.execute(
+            "SELECT (SELECT MIN(id) FROM CARD_CHANGES), "
+            "(SELECT MAX(id) FROM CARD_CHANGES)").fetchone()
+        if last is not None and last - first >= keep * 2:
+            carddb.execute("DELETE FROM CARD_CHANGES WHERE id <= ?",
+                           (last - keep,))
+
+    def cache_stats(self):
+        """Return the hit, miss and eviction counters of the card cache."""
+        return self.card_cache.stats()
+
+    def stats(self):
+        """
+        Return a dict of the totals of each operation recorded by
+        ``metrics``, empty if there are no metrics, and of the card cache.
+        """
+        return dict(operations=self.metrics.report()
+                    if self.metrics is not None else {},
+                    cache=self.cache_stats())
 
     def create_db(self):
-        """Create the CARDS table in the sqlite3 database."""
-        with sqlite3.connect(self.dbname) as carddb:
-            carddb.execute("""CREATE TABLE IF NOT EXISTS CARDS(code STRING,
-            name STRING, abilities STRING, attributes STRING, info STRING)""")
+        """
+        Create the CARDS table in the sqlite3 database or upgrade an existing
+        database to the current schema version. Returns the number of schema
+        migrations that were applied.
+        """
+        applied = schema.upgrade(self.connection(), self)
+        if self.membership is not None:
+            self.rebuild_membership()
+        return applied
 
-    def load_card(self, code, cache=True):
+    def add_hooks(self, save=None, load=None):
+        """
+        Add a save hook to the end of the ``save_chain`` and a load hook to the
+        start of the ``load_chain``, so that hooks added together undo each
+        others changes in the reverse order they were made.
+        """
+        if save is not None:
+            self.save_chain.append(save)
+        if load is not None:
+            self.load_chain.insert(0, load)
+
+    @staticmethod
+    def _run_chain(chain, field, data):
+        """Pass the data of a field through each hook of a chain in turn."""
+        for hook in chain:
+            data = hook(field, data)
+        return data
+
+    def _encode_field(self, field, value):
+        """Encode the value of a field as it is to be stored in CARDS."""
+        data = self.codec.encode(value)
+        if self.save_chain:
+            data = self._run_chain(self.save_chain, field, data)
+        return data
+
+    def _decode_field(self, field, data):
+        """Decode the value of a field from its data stored in CARDS."""
+        if self.load_chain:
+            data = self._run_chain(self.load_chain, field, data)
+        return decode(data)
+
+    def _card_row(self, card):
+        """Convert a card into a row of values to be stored in CARDS."""
+        carddict = card.save()
+        if self.save_chain:
+            return [carddict["code"], carddict["name"]] + [
+                self._encode_field(key, carddict[key])
+                for key in ENCODED_FIELDS]
+        encode = self.codec.encode
+        return [carddict["code"], carddict["name"]] + [
+            encode(carddict[key]) for key in ENCODED_FIELDS]
+
+    def _row_dict(self, fields, row):
+        """
+        Return a dict of the given fields and their values decoded from a row
+        of those fields stored in CARDS.
+        """
+        rowdict = dict(zip(fields, row))
+        for key in ENCODED_FIELDS:
+            if key in rowdict:
+                rowdict[key] = self._decode_field(key, rowdict[key])
+        return rowdict
+
+    def _row_card(self, row):
+        """Construct a card from a row of values stored in CARDS."""
+        if getattr(self.cardclass, "lazy", False):
+            return self.cardclass(row[0], row[1], encoded=dict(
+                zip(ENCODED_FIELDS, row[2:])), decode=self._decode_field,
+                on_decode=self.card_cache.resize
+                if self.card_cache.maxsize is not None else None)
+        return self.cardclass(loaddict=self._row_dict(FIELDS, row))
+
+    def load_card(self, code, cache=True, fields=None):
         """
         Load a card with the given code from the database. This calls each
-        save event hook on the save string before commiting it to the database.
+        load hook on the stored data before decoding it into a card.
 
         Will cache each resulting card for faster future lookups with this
         method while respecting the libraries cache limit. However only if the
         cache argument is True.
 
+        If fields is given a dict of only those fields is loaded, like
+        ``Library.retrieve_all``, without using the cache.
+
         Will return None if the card could not be loaded.
         """
+        if fields is not None:
+            return self._select_fields((code,), fields).get(str(code))
+        if self.coherence is not None:
+            self._check_changes()
         card = self.card_cache.get(code, None)
         if card is None:
-            code = code if isinstance(code, str) else str(code)
-            with sqlite3.connect(self.dbname) as carddb:
-                result = carddb.execute(
-                    "SELECT * FROM CARDS WHERE code = ?", (code,))
-                loadrow = result.fetchone()
-                if not loadrow:
-                    return None
-                loaddict = dict(zip(FIELDS, loadrow))
-                card = self.cardclass(loaddict=loaddict)
+            card = self._select_card(code)
+            if card is None:
+                return None
             if cache:
                 self.cache_card(card)
         return card
 
-    def save_card(self, card, cache=False):
+    def _select_card(self, code):
+        """
+        Load the card with the given code from the database, ignoring the
+        cache, or return None if there is no such card.
         """
-        Save the given card to the database. This calls each save event hook
-        on the save string before commiting it to the database.
+        key = code if isinstance(code, str) else str(code)
+        if not self._may_exist(key):
+            return None
+        if self.pack is not None:
+            carddict = self.pack.get(key)
+            card = self.cardclass(loaddict=carddict) if carddict else None
+        else:
+            loadrow = self.connection().execute(
+                "SELECT * FROM CARDS WHERE code = ?", (key,)).fetchone()
+            card = self._row_card(loadrow) if loadrow else None
+        if card is None and self.negative_cache is not None:
+            self.negative_cache.add(key)
+        return card
+
+    def _select_cards(self, codes):
         """
+        Load the cards with the given codes from the database, ignoring the
+        cache, ``CHUNK_SIZE`` codes at a time. Returns a dict of each loaded
+        card by the ``str()`` of its code.
+        """
+        if self.pack is not None:
+            cards = (self._select_card(code) for code in codes)
+            return dict((str(card.code), card) for card in cards if card)
+        keys = [code if isinstance(code, str) else str(code)
+                for code in codes]
+        keys = [key for key in keys if self._may_exist(key)]
+        found = {}
+        carddb = self.connection()
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            command = "SELECT * FROM CARDS WHERE code IN ({0})".format(
+                ", ".join("?" * len(chunk)))
+            for loadrow in carddb.execute(command, chunk):
+                card = self._row_card(loadrow)
+                found[str(card.code)] = card
+        if self.negative_cache is not None:
+            for key in keys:
+                if key not in found:
+                    self.negative_cache.add(key)
+        return found
+
+    def _select_fields(self, codes, fields):
+        """
+        Load dicts of the given fields of the cards with the given codes,
+        ``CHUNK_SIZE`` codes at a time, only reading those fields from the
+        database. Returns a dict of each loaded dict by the ``str()`` of its
+        card's code.
+        """
+        fields = check_fields(fields)
+        keys = [key for key in set(str(code) for code in codes)
+                if self._may_exist(key)]
+        found = {}
+        if self.pack is not None:
+            for key in keys:
+                carddict = self.pack.get(key)
+                if carddict is not None:
+                    found[key] = project(fields, carddict)
+            return found
+        carddb = self.connection()
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            command = "SELECT code, {0} FROM CARDS WHERE code IN ({1})".format(
+                ", ".join(fields), ", ".join("?" * len(chunk)))
+            for row in carddb.execute(command, chunk):
+                found[str(row[0])] = self._row_dict(fields, row[1:])
+        return found
+
+    def load_cards(self, codes, cache=True, fields=None):
+        """
+        Load the cards with each of the given codes and return them in a list
+        in the same order as the codes, with None in place of any card that
+        could not be loaded.
+
+        Cards found in the cache are used as is while all others are loaded
+        with as few queries as possible, ``CHUNK_SIZE`` codes at a time. The
+        loaded cards are cached if the cache argument is True.
+
+        If fields is given dicts of only those fields are loaded, like
+        ``Library.retrieve_all``, without using the cache.
+        """
+        if fields is not None:
+            codes = list(codes)
+            found = self._select_fields(codes, fields)
+            return [found.get(str(code)) for code in codes]
+        if self.coherence is not None:
+            self._check_changes()
+        found = {}
+        missing = []
+        for code in codes:
+            key = str(code)
+            if key in found:
+                continue
+            card = self.card_cache.get(code, None)
+            found[key] = card
+            if card is None:
+                missing.append(key)
+
+        loaded = self._select_cards(missing)
         if cache:
-            self.cache_card(card)
-        carddict = card.save()
-        with sqlite3.connect(self.dbname) as carddb:
-            carddb.execute("DELETE from CARDS where code = ?",
-                           (carddict["code"],))
-            carddb.execute("INSERT INTO CARDS VALUES(?, ?, ?, ?, ?)",
-                           [carddict[key] if isinstance(carddict[key], str)
-                            else str(carddict[key]) for key in FIELDS])
+            for card in loaded.values():
+                self.cache_card(card)
+        found.update(loaded)
+
+        return [found[str(code)] for code in codes]
+
+    def save_card(self, card, cache=False):
+        """
+        Save the given card to the database. This calls each save hook on the
+        encoded data before commiting it to the database.
+        """
+        self.save_cards((card,), cache)
+
+    def save_cards(self, cards, cache=False):
+        """
+        Save all of the given cards to the database in a single transaction,
+        updating any cards already stored with the same codes in place so
+        they keep their rowid. Returns the number of cards saved.
+        """
+        if self.pack is not None:
+            raise sqlite3.OperationalError(
+                "attempt to write a readonly database")
+        cards = list(cards)
+        rows = []
+        for card in cards:
+            if cache:
+                self.cache_card(card)
+            rows.append(self._card_row(card))
+        with self.transaction() as carddb:
+            self._local.saved.update(row[0] for row in rows)
+            if UPSERT:
+                carddb.executemany(
+                    "INSERT INTO CARDS VALUES(?, ?, ?, ?, ?) "
+                    "ON CONFLICT(code) DO UPDATE SET name = excluded.name, "
+                    "abilities = excluded.abilities, "
+                    "attributes = excluded.attributes, info = excluded.info",
+                    rows)
+            else:
+                carddb.executemany(
+                    "UPDATE CARDS SET name = ?, abilities = ?, "
+                    "attributes = ?, info = ? WHERE code = ?",
+                    [row[1:] + row[:1] for row in rows])
+                carddb.executemany(
+                    "INSERT OR IGNORE INTO CARDS VALUES(?, ?, ?, ?, ?)", rows)
+            self._save_index(carddb, cards)
+            if self.fulltext:
+                self._save_fulltext(carddb, cards)
+            if self.keep_changes is not None:
+                self._trim_changes(carddb, self.keep_changes)
+        if self._card_index is not None:
+            for card in cards:
+                self._card_index.add(card)
+        for card in cards:
+            key = str(card.code)
+            if self.membership is not None:
+                self._add_member(key)
+            if self.negative_cache is not None:
+                self.negative_cache.discard(key)
+        return len(cards)
 
-    def retrieve_all(self):
+    def _save_index(self, carddb, cards, replace=True):
+        """
+        Store the attributes, abilities and info of the given cards in the
+        index tables used by ``filter_search``. Any rows previously stored for
+        these cards are removed first if replace is True.
+        """
+        attributes = []
+        abilities = []
+        info = []
+        for card in cards:
+            code = card.code
+            for attribute in card.attributes:
+                attributes.append((code, index_value(attribute)))
+            for phase, value in card.abilities.items():
+                phase = index_value(phase)
+                for elem in index_elements(value):
+                    abilities.append((code, phase, elem))
+            for key, value in card.info.items():
+                key = index_value(key)
+                for elem in index_elements(value):
+                    info.append((code, key, elem))
+
+        if replace:
+            codes = [(card.code,) for card in cards]
+            for table in schema.INDEX_TABLES:
+                carddb.executemany(
+                    "DELETE FROM {0} WHERE code = ?".format(table), codes)
+        carddb.executemany("INSERT OR IGNORE INTO CARD_ATTRIBUTES "
+                           "VALUES(?, ?)", attributes)
+        carddb.executemany("INSERT OR IGNORE INTO CARD_ABILITIES "
+                           "VALUES(?, ?, ?)", abilities)
+        carddb.executemany("INSERT OR IGNORE INTO CARD_INFO VALUES(?, ?, ?)",
+                           info)
+
+    def _fulltext_row(self, card):
+        """Return the text of a card to store in the CARDS_FTS index."""
+        abilities = []
+        for value in card.abilities.values():
+            abilities.extend(value if isinstance(value, list) else [value])
+        info = []
+        for key in self.fulltext_info:
+            value = card.info.get(key)
+            if value is not None:
+                info.extend(value if isinstance(value, list) else [value])
+        return (card.name, " ".join(str(elem) for elem in abilities),
+                " ".join(str(elem) for elem in info), card.code)
+
+    def _save_fulltext(self, carddb, cards):
+        """
+        Add the given cards, already stored in CARDS, to CARDS_FTS replacing
+        the text of any that were stored before.
+        """
+        carddb.executemany(
+            "INSERT OR REPLACE INTO CARDS_FTS(rowid, code, name, abilities, "
+            "info) SELECT rowid, code, ?, ?, ? FROM CARDS WHERE code = ?",
+            [self._fulltext_row(card) for card in cards])
+
+    def rebuild_fulltext(self):
+        """
+        Create the CARDS_FTS full text index if it does not exist and fill it
+        with every stored card. This needs sqlite to be built with FTS5.
+        """
+        with self.transaction() as carddb:
+            carddb.execute("DROP TABLE IF EXISTS CARDS_FTS")
+            carddb.execute("""CREATE VIRTUAL TABLE CARDS_FTS USING fts5(
+            code UNINDEXED, name, abilities, info)""")
+            result = carddb.execute("SELECT * FROM CARDS")
+            while True:
+                rows = result.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                self._save_fulltext(carddb, [self._row_card(row)
+                                             for row in rows])
+
+    def text_search(self, query, limit=10):
+        """
+        Return a list of up to limit codes and names of cards whose name,
+        abilities or indexed info match the given FTS5 query, best matches
+        first. For example ``"fire"``, ``"fir*"`` or ``"name:ant"``.
+
+        The library must have been created with ``fulltext=True``.
+        """
+        return self.connection().execute(
+            "SELECT code, name FROM CARDS_FTS WHERE CARDS_FTS MATCH ? "
+            "ORDER BY rank LIMIT ?", (query, limit)).fetchall()
+
+    def migrate_codec(self, batch=CHUNK_SIZE):
+        """
+        Re-encode every stored card that was not stored with this libraries
+        codec, including legacy cards stored with ``str()``. If there are any
+        load or save hooks, every card whose stored data would be changed by
+        re-encoding it through them is also converted, such as to compress
+        existing cards after adding a ``librarian.compression.Compressor``.
+
+        Cards are converted ``batch`` at a time with each batch committed
+        separately so the library may continue to be used while it is being
+        migrated.
+
+        Returns the number of cards that were converted.
+        """
+        carddb = self.connection()
+        fields = ", ".join(ENCODED_FIELDS)
+        query = "SELECT rowid, {0} FROM CARDS WHERE rowid > ? " \
+            "ORDER BY rowid LIMIT ?".format(fields)
+        update = "UPDATE CARDS SET {0} WHERE rowid = ?".format(
+            ", ".join("{0} = ?".format(key) for key in ENCODED_FIELDS))
+        tag = self.codec.tag
+        hooked = self.save_chain or self.load_chain
+        converted = 0
+        lastrow = -1
+        while True:
+            rows = carddb.execute(query, (lastrow, batch)).fetchall()
+            if not rows:
+                return converted
+            lastrow = rows[-1][0]
+            changed = []
+            for row in rows:
+                if not hooked and all(getattr(lookup(data), "tag", None) ==
+                                      tag for data in row[1:]):
+                    continue
+                stored = [self._encode_field(key, self._decode_field(
+                    key, data)) for key, data in zip(ENCODED_FIELDS, row[1:])]
+                if stored != list(row[1:]):
+                    changed.append(stored + [row[0]])
+            with self.transaction():
+                carddb.executemany(update, changed)
+            converted += len(changed)
+
+    def retrieve_all(self, cache=True, fields=None, chunked=False,
+                     batch=CHUNK_SIZE):
         """
         A generator that iterates over each card in the library database.
 
         This is best used in for loops as it will only load a card from the
-        library as needed rather then all at once.
+        library as needed rather then all at once. Cards are read in order of
+        code ``batch`` rows at a time, each batch with its own query for the
+        codes after the last card read, so cards may be saved while iterating.
+        A card saved with a code after the last card read is produced once
+        it is reached.
+
+        If cache is True cards already in the cache are used as is and every
+        other card is cached as it is loaded, otherwise the cache is neither
+        used nor changed.
+
+        If fields is given it should be a list of field names from ``FIELDS``
+        and a dict of only those fields will be produced for each card in
+        place of a card object. These are never cached.
+
+        If chunked is True lists of up to ``batch`` cards are produced rather
+        then single cards.
         """
-        with sqlite3.connect(self.dbname) as carddb:
-            for row in carddb.execute("SELECT code FROM CARDS"):
-                yield self.load_card(row[0])
+        if fields is not None:
+            fields = check_fields(fields)
+
+        if cache and self.coherence is not None:
+            self._check_changes()
+        if self.pack is not None:
+            packed = iter(self.pack)
+
+            def fetch(size):
+                return list(islice(packed, size))
+            if fields is not None:
+                convert = partial(project, fields)
+            else:
+                convert = partial(self._dict_card, cache)
+        else:
+            if fields is not None:
+                convert = partial(self._row_dict, fields)
+            else:
+                convert = self._cached_row_card if cache else self._row_card
+            fetch = self._keyset_fetch(fields if fields is not None
+                                       else FIELDS)
+
+        while True:
+            rows = fetch(batch)
+            if not rows:
+                break
+            cards = [convert(row) for row in rows]
+            if chunked:
+                yield cards
+            else:
+                for card in cards:
+                    yield card
+
+    def _keyset_fetch(self, fields):
+        """
+        Return a function that reads the next rows of the given fields of
+        CARDS, in order of code, up to the given number of rows at a time.
+        Each call is a separate query for the codes after the last row read
+        so no statement is left open between calls.
+        """
+        columns = fields if "code" in fields else fields + ("code",)
+        position = columns.index("code")
+        command = "SELECT {0} FROM CARDS".format(", ".join(columns))
+        first = command + " ORDER BY code LIMIT ?"
+        after = command + " WHERE code > ? ORDER BY code LIMIT ?"
+        last = []
+
+        def fetch(size):
+            if last:
+                rows = self.connection().execute(after, (last[0], size))
+            else:
+                rows = self.connection().execute(first, (size,))
+            rows = rows.fetchall()
+            if rows:
+                last[:] = [rows[-1][position]]
+            return rows
+        return fetch
+
+    def _dict_card(self, cache, carddict):
+        """
+        Construct a card from a carddict, using and filling the cache if
+        cache is True.
+        """
+        if not cache:
+            return self.cardclass(loaddict=carddict)
+        card = self.card_cache.get(carddict["code"], None)
+        if card is None:
+            card = self.cardclass(loaddict=carddict)
+            self.cache_card(card)
+        return card
+
+    def export_pack(self, path, codec=None):
+        """
+        Write every card in the library to a read only card pack at the given
+        path, see ``librarian.pack.write_pack``. Returns the number of cards
+        written.
+        """
+        return write_pack(path, self.retrieve_all(cache=False, fields=FIELDS),
+                          codec)
+
+    def import_stream(self, source, format="jsonl", batch=stream.BATCH_SIZE,
+                      processes=None, progress=None, cache=False):
+        """
+        Save every card of a card set in the given format, ``"jsonl"`` or
+        ``"csv"``, as written by ``Library.export_stream``. The source may be
+        a path, a file object or any iterable of lines, replacing any cards
+        already stored with the same codes.
+
+        Cards are parsed and saved ``batch`` at a time, each batch in a
+        single transaction, so memory use does not grow with the size of the
+        set. If ``processes`` is more then 1 the cards are parsed on a pool of
+        that many processes while they are saved, see
+        ``librarian.stream.parse_stream``.
+
+        If progress is given it is called after each batch with a dict of
+        the number of cards saved so far, the seconds taken and the cards
+        saved per second. Returns the number of cards saved.
+        """
+        stream.check_format(format)
+        source, opened = stream.open_stream(source, "r")
+        start = time.time()
+        count = 0
+        try:
+            for carddicts in stream.parse_stream(
+                    stream.read_records(source, format), format, batch,
+                    processes):
+                count += self.save_cards([self.cardclass(loaddict=carddict)
+                                          for carddict in carddicts], cache)
+                if progress is not None:
+                    progress(stream.progress_report(count, start))
+        finally:
+            if opened:
+                source.close()
+        return count
+
+    def export_stream(self, destination, format="jsonl",
+                      batch=stream.BATCH_SIZE, progress=None):
+        """
+        Write every card in the library to the given path or file object in
+        the given format, ``"jsonl"`` or ``"csv"``, reading ``batch`` cards at
+        a time without using the cache.
+
+        If progress is given it is called after each batch as with
+        ``Library.import_stream``. Returns the number of cards written.
+        """
+        stream.check_format(format)
+        destination, opened = stream.open_stream(destination, "w")
+        start = time.time()
+        count = 0
+        try:
+            for written in stream.write_stream(
+                    destination, format, self.retrieve_all(
+                        cache=False, fields=FIELDS, chunked=True,
+                        batch=batch)):
+                count += written
+                if progress is not None:
+                    progress(stream.progress_report(count, start))
+        finally:
+            if opened:
+                destination.close()
+        return count
+
+    def _cached_row_card(self, row):
+        """
+        Return the cached card for a row of values stored in CARDS or
+        construct and cache the card if it is not cached.
+        """
+        card = self.card_cache.get(row[0], None)
+        if card is None:
+            card = self._row_card(row)
+            self.cache_card(card)
+        return card
+
+    def save_deck(self, deck, name):
+        """
+        Save the codes of the given deck under the given name, replacing any
+        deck already saved with that name. Each distinct code is stored once
+        with the number of times it is in the deck, so a loaded deck has its
+        cards grouped in the order each card first appears.
+        """
+        counts = OrderedDict()
+        for code in deck.cards:
+            counts[code] = counts.get(code, 0) + 1
+        with self.transaction() as carddb:
+            carddb.execute("INSERT OR IGNORE INTO DECKS(name) VALUES(?)",
+                           (name,))
+            deckid = carddb.execute("SELECT id FROM DECKS WHERE name = ?",
+                                    (name,)).fetchone()[0]
+            carddb.execute("DELETE FROM DECK_CARDS WHERE deck = ?", (deckid,))
+            carddb.executemany(
+                "INSERT INTO DECK_CARDS VALUES(?, ?, ?, ?)",
+                [(deckid, position, code, count) for position, (code, count)
+                 in enumerate(counts.items())])
+
+    def delete_deck(self, name):
+        """Delete the deck saved under the given name."""
+        with self.transaction() as carddb:
+            carddb.execute("DELETE FROM DECK_CARDS WHERE deck IN "
+                           "(SELECT id FROM DECKS WHERE name = ?)", (name,))
+            carddb.execute("DELETE FROM DECKS WHERE name = ?", (name,))
+
+    def load_deck(self, name, hydrate=False, compact=False):
+        """
+        Load the deck saved under the given name, or None if there is no such
+        deck, see ``Library.load_decks``.
+        """
+        return self.load_decks((name,), hydrate, compact).get(name)
+
+    def load_decks(self, names=None, hydrate=False, compact=False):
+        """
+        Load the decks saved under the given names, or every saved deck if no
+        names are given, with a single query. Returns a dict of each ``Deck``,
+        using this library, by its name.
+
+        If hydrate is True the distinct cards of the decks are loaded by the
+        same query and cached, so the decks can be drawn from without any
+        further queries while the cache is large enough to hold them.
+
+        If compact is True the decks are created as compact decks.
+        """
+        command = "SELECT DECKS.name, DECK_CARDS.code, DECK_CARDS.count"
+        if hydrate:
+            command += ", CARDS.*"
+        command += " FROM DECKS JOIN DECK_CARDS ON DECK_CARDS.deck = DECKS.id"
+        if hydrate:
+            command += " LEFT JOIN CARDS ON CARDS.code = DECK_CARDS.code"
+        params = []
+        if names is not None:
+            names = list(names)
+            command += " WHERE DECKS.name IN ({0})".format(
+                ", ".join("?" * len(names)))
+            params = names
+        command += " ORDER BY DECKS.id, DECK_CARDS.position"
+
+        decks = OrderedDict()
+        for row in self.connection().execute(command, params):
+            name, code, count = row[:3]
+            codes = decks.get(name)
+            if codes is None:
+                codes = decks[name] = []
+            codes.extend([code] * count)
+            if hydrate and row[3] is not None and code not in self.card_cache:
+                self.cache_card(self._row_card(row[3:]))
+        return dict((name, Deck(self, codes, compact))
+                    for name, codes in decks.items())
+
+    def query(self, *predicates, **filters):
+        """
+        Return a ``librarian.query.Query`` of the cards matched by every
+        given ``librarian.query.Predicate`` and by the keyword arguments of
+        ``Library.filter_search``. The query is only run when iterated over.
+        """
+        from .query import Query
+        return Query(self).where(*predicates, **filters)
 
     def filter_search(self, code=None, name=None, abilities=None,
-                      attributes=None, info=None):
+                      attributes=None, info=None, fields=None):
         """
         Return a list of codes and names pertaining to cards that have the
-        given information values stored.
+        given information values stored. If fields is given a list of dicts
+        of those fields of each card is returned instead, like
+        ``Library.retrieve_all``.
 
         Can take a code integer, name string, abilities dict {phase: ability
         list/"*"}, attributes list, info dict {key, value list/"*"}.
 
         In the above argument examples "*" is a string that may be passed
         instead of a list as the dict value to match anything that stores that
-        key.
+        key. See ``Where_filter_gen`` for how each argument is matched.
         """
-        command = "SELECT code, name FROM CARDS "
-        command += Where_filter_gen(("code", code), ("name", name),
-                                    ("abilities", abilities),
-                                    ("attributes", attributes),
-                                    ("info", info))
-
-        with sqlite3.connect(self.dbname) as carddb:
-            return carddb.execute(command).fetchall()
-
-    def connection(self):
-        """Connect to the underlying database and return the connection."""
-        return sqlite3.connect(self.dbname)
+        where, params = Where_filter_gen(("code", code), ("name", name),
+                                         ("abilities", abilities),
+                                         ("attributes", attributes),
+                                         ("info", info))
+        if fields is None:
+            command = "SELECT code, name FROM CARDS " + where
+            return self.connection().execute(command, params).fetchall()
+        fields = check_fields(fields)
+        command = "SELECT {0} FROM CARDS {1}".format(", ".join(fields), where)
+        return [self._row_dict(fields, row)
+                for row in self.connection().execute(command, params)]
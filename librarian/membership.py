@@ -0,0 +1,81 @@
+"""Structures recording which card codes exist in a library."""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+import math
+
+
+class CodeSet(object):
+    """Records the exact set of card codes, as strings, in a library."""
+    def __init__(self):
+        self.codes = set()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.codes
+
+    def add(self, code):
+        """Record that the given code exists."""
+        self.codes.add(code)
+
+    def clear(self):
+        """Forget every code."""
+        self.codes.clear()
+
+    def empty(self):
+        """Return a new, empty, CodeSet."""
+        return CodeSet()
+
+
+class BloomFilter(object):
+    """
+    Records card codes, as strings, in a fixed number of bits sized for the
+    given capacity so that a code that was never added is reported as present
+    at most ``error_rate`` of the time while a code that was added is always
+    reported as present.
+
+    This uses far less memory then a ``CodeSet`` for very large libraries.
+    The hashes used are only valid within a single process.
+    """
+    def __init__(self, capacity=1000000, error_rate=0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) /
+                               math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / float(capacity) *
+                                       math.log(2))))
+        self.count = 0
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, code):
+        """Return the bit positions for the given code."""
+        value = hash(code)
+        first = value & 0xffffffff
+        second = (value >> 32) | 1
+        return [(first + number * second) % self.size
+                for number in range(self.hashes)]
+
+    def __contains__(self, code):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(code))
+
+    def add(self, code):
+        """Record that the given code exists."""
+        bits = self.bits
+        for position in self._positions(code):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def clear(self):
+        """Forget every code."""
+        self.bits = bytearray(len(self.bits))
+        self.count = 0
+
+    def empty(self):
+        """Return a new, empty, BloomFilter of the same size."""
+        return BloomFilter(self.capacity, self.error_rate)
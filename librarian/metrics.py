@@ -0,0 +1,219 @@
+"""Timers, counters and a slow query log for the operations of a Library."""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+import logging
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+
+# The most precise clock available, python 2 has no ``time.perf_counter``.
+CLOCK = getattr(time, "perf_counter", time.time)
+
+
+def count_found(cards):
+    """Return the number of cards in a list that are not None."""
+    return sum(1 for card in cards if card is not None)
+
+
+def count_one(card):
+    """Return 1 if a card was found, otherwise 0."""
+    return 0 if card is None else 1
+
+
+def count_value(value):
+    """Return a count that was returned as is."""
+    return value
+
+
+# The name of each instrumented Library method and a function counting the
+# rows in its result, or None if its result is not counted.
+OPERATIONS = (
+    ("load_card", count_one),
+    ("load_cards", count_found),
+    ("_select_card", count_one),
+    ("_select_cards", len),
+    ("save_cards", count_value),
+    ("filter_search", len),
+    ("text_search", len),
+    ("load_decks", len),
+    ("save_deck", None),
+    ("migrate_codec", count_value),
+    ("rebuild_fulltext", None),
+)
+# Instrumented Library methods that are generators, the rows they produce
+# are counted as they are iterated.
+GENERATORS = ("retrieve_all",)
+
+
+class _Local(threading.local):
+    """The state of the operations running in a single thread."""
+    def __init__(self, statements):
+        self.depth = 0
+        self.steps = 0
+        self.statements = deque(maxlen=statements)
+
+
+class Metrics(object):
+    """
+    Collects the number of calls, errors, seconds taken and rows produced by
+    each operation of a ``librarian.library.Library`` it is given to. The
+    totals are returned by ``Metrics.report`` while each call is also passed
+    to ``callback``, if given, as a dict so it may be forwarded elsewhere.
+
+    The amount of work done by sqlite is counted, per thread, in virtual
+    machine steps of ``step_interval`` instructions. This is the closest
+    measure of the rows scanned by a query that sqlite makes available.
+
+    If ``slow_query`` is given, any operation taking at least that many
+    seconds is logged as a warning to ``logger``, which defaults to the
+    ``librarian.metrics`` logger, along with the last ``statements`` SQL
+    statements, with their parameters, that it executed. The statements are
+    only traced on python 3.3 and later, earlier versions log slow operations
+    without them.
+
+    A library without metrics is not instrumented at all so costs nothing.
+    """
+    def __init__(self, slow_query=None, callback=None, logger=None,
+                 statements=10, step_interval=1000, clock=CLOCK):
+        self.slow_query = slow_query
+        self.callback = callback
+        self.logger = logger if logger is not None else \
+            logging.getLogger(__name__)
+        self.step_interval = step_interval
+        self.clock = clock
+        self._operations = {}
+        self._lock = threading.Lock()
+        self._local = _Local(statements)
+
+    def instrument(self, library):
+        """
+        Replace each operation listed in ``OPERATIONS`` and ``GENERATORS`` on
+        the given library with one that records its use.
+        """
+        for name, rows in OPERATIONS:
+            setattr(library, name, self._wrap(name.lstrip("_"),
+                                              getattr(library, name), rows))
+        for name in GENERATORS:
+            setattr(library, name, self._wrap_generator(
+                name.lstrip("_"), getattr(library, name)))
+
+    def attach(self, carddb):
+        """Count the steps and trace the statements of a connection."""
+        carddb.set_progress_handler(self._progress, self.step_interval)
+        trace = getattr(carddb, "set_trace_callback", None)
+        if self.slow_query is not None and trace is not None:
+            trace(self._local.statements.append)
+
+    def _progress(self):
+        """Count a step of a query, returning 0 so it is not interrupted."""
+        self._local.steps += 1
+        return 0
+
+    def _wrap(self, name, method, rows):
+        """Return a function that records each call of the given method."""
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            local = self._local
+            if not local.depth:
+                local.statements.clear()
+            local.depth += 1
+            steps = local.steps
+            start = self.clock()
+            result = None
+            error = True
+            try:
+                result = method(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                local.depth -= 1
+                self.record(name, self.clock() - start,
+                            rows(result) if rows and not error else None,
+                            local.steps - steps, error)
+        return wrapper
+
+    def _wrap_generator(self, name, method):
+        """
+        Return a generator function that records the use of the given
+        generator method from its first to last item, excluding the time
+        spent by the caller between items.
+        """
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            local = self._local
+            if not local.depth:
+                local.statements.clear()
+            iterator = method(*args, **kwargs)
+            seconds = 0.0
+            steps = 0
+            rows = 0
+            error = False
+            try:
+                while True:
+                    local.depth += 1
+                    before = local.steps
+                    start = self.clock()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    finally:
+                        seconds += self.clock() - start
+                        steps += local.steps - before
+                        local.depth -= 1
+                    rows += len(item) if isinstance(item, list) else 1
+                    yield item
+            except Exception:
+                error = True
+                raise
+            finally:
+                self.record(name, seconds, rows, steps, error)
+        return wrapper
+
+    def record(self, operation, seconds, rows=None, steps=None, error=False):
+        """
+        Record a call of the named operation that took the given seconds,
+        produced the given number of rows and ran the given number of steps.
+        """
+        with self._lock:
+            totals = self._operations.get(operation)
+            if totals is None:
+                totals = self._operations[operation] = dict(
+                    calls=0, errors=0, seconds=0.0, max_seconds=0.0, rows=0,
+                    steps=0)
+            totals["calls"] += 1
+            totals["errors"] += error
+            totals["seconds"] += seconds
+            totals["max_seconds"] = max(totals["max_seconds"], seconds)
+            totals["rows"] += rows or 0
+            totals["steps"] += (steps or 0) * self.step_interval
+
+        slow = self.slow_query is not None and seconds >= self.slow_query
+        statements = list(self._local.statements) if slow else []
+        if slow:
+            self.logger.warning("Slow %s took %.3f seconds: %s", operation,
+                                seconds, "; ".join(statements))
+        if self.callback is not None:
+            self.callback(dict(operation=operation, seconds=seconds,
+                               rows=rows, steps=(steps or 0) *
+                               self.step_interval, error=error, slow=slow,
+                               statements=statements))
+
+    def report(self):
+        """
+        Return a dict of the totals of each operation by its name, along with
+        the mean seconds per call.
+        """
+        with self._lock:
+            report = dict((operation, dict(totals))
+                          for operation, totals in self._operations.items())
+        for totals in report.values():
+            totals["mean_seconds"] = totals["seconds"] / totals["calls"]
+        return report
+
+    def reset(self):
+        """Forget the totals of every operation."""
+        with self._lock:
+            self._operations.clear()
@@ -0,0 +1,159 @@
+"""Read only card packs that are memory mapped for fast loading."""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+import mmap
+import os
+import struct
+from six import integer_types, text_type
+from .codec import JSONCodec, decode
+
+
+MAGIC = b"LBPK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQQ")
+ENTRY = struct.Struct("<qQI")
+# Python 2 has no ``os.replace``, its ``os.rename`` replaces the destination
+# on POSIX systems.
+replace_file = getattr(os, "replace", os.rename)
+
+
+def write_pack(path, carddicts, codec=None):
+    """
+    Write a card pack to the given path from an iterable of carddicts, as
+    produced by ``Card.save``, each encoded whole with the given codec which
+    defaults to ``librarian.codec.JSONCodec``.
+
+    A card pack is laid out as:
+     * A header of the magic bytes ``MAGIC``, the format ``VERSION``, the
+       number of cards and the offset of the index.
+     * The encoded cards.
+     * The index, an entry of the code, offset and length of every card
+       sorted by code so a card can be found with a binary search.
+
+    Card codes must be integers that fit in 64 bits. The pack is written to
+    a temporary file that replaces any existing file at the path once it is
+    complete. Returns the number of cards written.
+    """
+    codec = codec if codec is not None else JSONCodec()
+    partial = path + ".tmp"
+    try:
+        count = _write_pack(partial, carddicts, codec)
+    except Exception:
+        os.remove(partial)
+        raise
+    replace_file(partial, path)
+    return count
+
+
+def _write_pack(path, carddicts, codec):
+    """Write a card pack, see ``write_pack``."""
+    entries = []
+    with open(path, "wb") as packfile:
+        packfile.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+        offset = HEADER.size
+        for carddict in carddicts:
+            code = carddict["code"]
+            if not isinstance(code, integer_types) or isinstance(code, bool):
+                raise ValueError(
+                    "Card packs need integer codes, not {0!r}".format(code))
+            data = codec.encode(carddict)
+            if isinstance(data, text_type):
+                data = data.encode("utf-8")
+            packfile.write(data)
+            entries.append((code, offset, len(data)))
+            offset += len(data)
+
+        entries.sort()
+        for previous, entry in zip(entries, entries[1:]):
+            if previous[0] == entry[0]:
+                raise ValueError("Duplicate card code {0}".format(entry[0]))
+        for entry in entries:
+            packfile.write(ENTRY.pack(*entry))
+        packfile.seek(0)
+        packfile.write(HEADER.pack(MAGIC, VERSION, 0, len(entries), offset))
+    return len(entries)
+
+
+class CardPack(object):
+    """
+    A card pack written by ``write_pack`` opened with ``mmap``. Cards are
+    found with a binary search of the index and only the found card is
+    decoded, nothing is read from the file until it is needed.
+
+    As the file is mapped read only, any number of processes, including
+    those forked after the pack is opened, share the same pages of the file
+    through the operating system's page cache.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as packfile:
+            self._map = mmap.mmap(packfile.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        magic, version, _, self.count, self.index_offset = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("{0} is not a card pack".format(path))
+        if version != VERSION:
+            self.close()
+            raise ValueError("Unsupported card pack version {0}".format(
+                version))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, code):
+        return self._find(code) is not None
+
+    def __iter__(self):
+        """Iterate over the carddict of every card in order of code."""
+        for position in range(self.count):
+            yield self._decode(self._entry(position))
+
+    def close(self):
+        """Unmap the pack file."""
+        self._map.close()
+
+    def _entry(self, position):
+        """Return the code, offset and length of an index entry."""
+        return ENTRY.unpack_from(self._map,
+                                 self.index_offset + position * ENTRY.size)
+
+    def _find(self, code):
+        """Return the index entry for the given code or None."""
+        try:
+            code = int(code)
+        except (TypeError, ValueError):
+            return None
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._entry(middle)
+            if entry[0] < code:
+                low = middle + 1
+            elif entry[0] > code:
+                high = middle
+            else:
+                return entry
+        return None
+
+    def _decode(self, entry):
+        """Decode the card of an index entry into a carddict."""
+        _, offset, length = entry
+        return decode(self._map[offset:offset + length])
+
+    def codes(self):
+        """Iterate over the code of every card in order."""
+        for position in range(self.count):
+            yield self._entry(position)[0]
+
+    def get(self, code):
+        """Return the carddict of the card with the given code or None."""
+        entry = self._find(code)
+        return self._decode(entry) if entry is not None else None
@@ -0,0 +1,329 @@
+"""Composable queries of the cards in a Library."""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+from .library import CHUNK_SIZE, FIELDS, Where_filter_gen, check_fields
+
+
+ORDER_FIELDS = ("code", "name")
+
+
+class Predicate(object):
+    """
+    A condition on the cards of a library that compiles to a parameterized
+    sqlite expression. Predicates are combined with ``&``, ``|`` and ``~``.
+
+    Subclasses implement ``compile``.
+    """
+    def compile(self):
+        """Return the sqlite expression and a list of its parameters."""
+        raise NotImplementedError()
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Where(Predicate):
+    """
+    Matches cards like ``Library.filter_search`` given the same keyword
+    arguments, see ``librarian.library.Where_filter_gen``. Matches every
+    card if no filters are given.
+    """
+    def __init__(self, **filters):
+        unknown = set(filters).difference(FIELDS)
+        if unknown:
+            raise ValueError("Unknown fields: {0}".format(
+                ", ".join(sorted(unknown))))
+        self.filters = filters
+
+    def compile(self):
+        where, params = Where_filter_gen(*[
+            (field, self.filters.get(field)) for field in FIELDS])
+        return (where[len("WHERE "):] if where else "1"), params
+
+
+class CodeRange(Predicate):
+    """
+    Matches cards whose code is at least ``low`` and at most ``high``, either
+    of which may be None to leave that end open.
+    """
+    def __init__(self, low=None, high=None):
+        self.low = low
+        self.high = high
+
+    def compile(self):
+        clauses = []
+        params = []
+        if self.low is not None:
+            clauses.append("code >= ?")
+            params.append(self.low)
+        if self.high is not None:
+            clauses.append("code <= ?")
+            params.append(self.high)
+        return " AND ".join(clauses) or "1", params
+
+
+class CodeIn(Predicate):
+    """Matches cards whose code is one of the given codes."""
+    def __init__(self, codes):
+        self.codes = list(codes)
+
+    def compile(self):
+        if not self.codes:
+            return "0", []
+        return "code IN ({0})".format(", ".join("?" * len(self.codes))), \
+            list(self.codes)
+
+
+class And(Predicate):
+    """Matches cards matched by every one of the given predicates."""
+    joiner = " AND "
+
+    def __init__(self, *predicates):
+        self.predicates = predicates
+
+    def compile(self):
+        clauses = []
+        params = []
+        for predicate in self.predicates:
+            clause, values = predicate.compile()
+            clauses.append("({0})".format(clause))
+            params.extend(values)
+        if not clauses:
+            return ("1" if self.joiner == " AND " else "0"), params
+        return self.joiner.join(clauses), params
+
+
+class Or(And):
+    """Matches cards matched by any of the given predicates."""
+    joiner = " OR "
+
+
+class Not(Predicate):
+    """Matches cards not matched by the given predicate."""
+    def __init__(self, predicate):
+        self.predicate = predicate
+
+    def compile(self):
+        clause, params = self.predicate.compile()
+        return "NOT ({0})".format(clause), params
+
+
+class Query(object):
+    """
+    A query of the cards of a ``librarian.library.Library`` that are matched
+    by a predicate, in order, that is only run when it is iterated over.
+
+    Queries are immutable, each method returns a new query, so a query may be
+    built up in steps and reused. For example::
+
+        query = library.query(attributes=["red"]) | Where(name="Drake")
+        for card in query.order_by("-name").limit(20):
+            ...
+
+    Iterating over a query streams the results ``batch`` rows at a time from
+    a single parameterized statement. The statement of each query is only
+    compiled once and as values are always bound as parameters every query
+    of the same shape shares the prepared statement that sqlite3 caches for
+    each connection.
+
+    Results are cards, using and filling the cache of the library if
+    ``cache`` is True, or dicts of the fields chosen with ``Query.select``.
+    Pages of results are found with keyset pagination, see ``Query.after``
+    and ``Query.pages``, so the cost of reading page N does not grow with N.
+    """
+    def __init__(self, library, predicate=None, order=("code",), fields=None,
+                 limit=None, after=None, cache=True, batch=CHUNK_SIZE):
+        self.library = library
+        self.predicate = predicate
+        self.order = tuple(order)
+        self.fields = fields
+        self._limit = limit
+        self._after = after
+        self.cache = cache
+        self.batch = batch
+        self._compiled = None
+
+    def _copy(self, **changes):
+        """Return a copy of this query with the given changes."""
+        options = dict(predicate=self.predicate, order=self.order,
+                       fields=self.fields, limit=self._limit,
+                       after=self._after, cache=self.cache, batch=self.batch)
+        options.update(changes)
+        return Query(self.library, **options)
+
+    def where(self, *predicates, **filters):
+        """
+        Return a query of the cards matched by this query and every given
+        predicate. Keyword arguments are added as a ``Where`` predicate.
+        """
+        predicates = list(predicates)
+        if filters:
+            predicates.append(Where(**filters))
+        if not predicates:
+            return self
+        if self.predicate is not None:
+            predicates.insert(0, self.predicate)
+        return self._copy(predicate=predicates[0] if len(predicates) == 1
+                          else And(*predicates))
+
+    def __and__(self, other):
+        return self.where(other)
+
+    def __or__(self, other):
+        predicate = self.predicate if self.predicate is not None else Where()
+        return self._copy(predicate=predicate | other)
+
+    def __invert__(self):
+        predicate = self.predicate if self.predicate is not None else Where()
+        return self._copy(predicate=~predicate)
+
+    def order_by(self, *fields):
+        """
+        Return a query ordered by the given fields, ``"code"`` or ``"name"``,
+        in ascending order or descending if prefixed with ``-``. The code is
+        always used to break ties so the order is the same every time.
+        """
+        order = []
+        for field in fields:
+            if field.lstrip("-") not in ORDER_FIELDS:
+                raise ValueError("Can not order by {0}".format(field))
+            order.append(field)
+        if not any(field.lstrip("-") == "code" for field in order):
+            order.append("code")
+        return self._copy(order=order)
+
+    def select(self, *fields):
+        """
+        Return a query producing dicts of the given fields, along with any
+        fields the query is ordered by, rather then cards.
+        """
+        return self._copy(fields=check_fields(fields))
+
+    def limit(self, count):
+        """Return a query producing at most count results."""
+        return self._copy(limit=count)
+
+    def after(self, last):
+        """
+        Return a query producing only the results after the given result, a
+        card or dict produced by this query or a tuple of its values of the
+        fields the query is ordered by.
+        """
+        if not isinstance(last, tuple):
+            names = [field.lstrip("-") for field in self.order]
+            if isinstance(last, dict):
+                last = tuple(last[name] for name in names)
+            else:
+                last = tuple(getattr(last, name) for name in names)
+        return self._copy(after=last)
+
+    def _columns(self):
+        """Return the fields read from the database for each result."""
+        if self.fields is None:
+            return FIELDS
+        return self.fields + tuple(
+            name for name in (field.lstrip("-") for field in self.order)
+            if name not in self.fields)
+
+    def compile(self):
+        """Return the sqlite statement of this query and its parameters."""
+        if self._compiled is None:
+            clauses = []
+            params = []
+            if self.predicate is not None:
+                clause, params = self.predicate.compile()
+                clauses.append("({0})".format(clause))
+                params = list(params)
+            if self._after is not None:
+                clause, values = self._keyset()
+                clauses.append(clause)
+                params.extend(values)
+            command = "SELECT {0} FROM CARDS".format(", ".join(
+                self._columns()))
+            if clauses:
+                command += " WHERE " + " AND ".join(clauses)
+            command += " ORDER BY " + ", ".join(
+                "{0} DESC".format(field[1:]) if field.startswith("-")
+                else field for field in self.order)
+            if self._limit is not None:
+                command += " LIMIT ?"
+                params.append(self._limit)
+            self._compiled = (command, params)
+        return self._compiled
+
+    def _keyset(self):
+        """
+        Return the expression and parameters matching rows that come after
+        the ``after`` values in the order of this query.
+        """
+        alternatives = []
+        params = []
+        for position, field in enumerate(self.order):
+            equal = [name.lstrip("-") + " = ?"
+                     for name in self.order[:position]]
+            name = field.lstrip("-")
+            greater = "{0} {1} ?".format(name, "<" if field.startswith("-")
+                                         else ">")
+            alternatives.append("({0})".format(" AND ".join(
+                equal + [greater])))
+            params.extend(self._after[:position + 1])
+        return "({0})".format(" OR ".join(alternatives)), params
+
+    def __iter__(self):
+        """Stream the results of this query."""
+        library = self.library
+        if self.fields is not None:
+            columns = self._columns()
+
+            def convert(row):
+                return library._row_dict(columns, row)
+        elif self.cache:
+            if library.coherence is not None:
+                library._check_changes()
+            convert = library._cached_row_card
+        else:
+            convert = library._row_card
+        command, params = self.compile()
+        result = library.connection().execute(command, params)
+        while True:
+            rows = result.fetchmany(self.batch)
+            if not rows:
+                break
+            for row in rows:
+                yield convert(row)
+
+    def all(self):
+        """Return a list of every result of this query."""
+        return list(self)
+
+    def first(self):
+        """Return the first result of this query or None."""
+        for result in self.limit(1):
+            return result
+        return None
+
+    def count(self):
+        """Return the number of cards matched, ignoring any limit."""
+        command, params = self._copy(limit=None, fields=("code",)).compile()
+        return self.library.connection().execute(
+            "SELECT count(*) FROM ({0})".format(command), params).fetchone()[0]
+
+    def pages(self, size):
+        """
+        Generate lists of up to size results, every result of this query in
+        order, reading each page with a separate keyset query.
+        """
+        query = self.limit(size)
+        while True:
+            page = list(query)
+            if page:
+                yield page
+            if len(page) < size:
+                return
+            query = query.after(page[-1])
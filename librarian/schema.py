@@ -0,0 +1,120 @@
+"""Versioned schema of the sqlite database behind a Library."""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+
+
+def table_exists(carddb, table):
+    """Return True if the given table exists in the database."""
+    return carddb.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (table,)).fetchone() is not None
+
+
+def cards_primary_key(carddb, library):
+    """
+    Version 1: Make ``code`` the primary key of the CARDS table.
+
+    Older databases allowed many rows for the same code, only the most
+    recently inserted row for each code is kept.
+    """
+    carddb.execute("""CREATE TABLE CARDS_V1(code STRING PRIMARY KEY,
+    name STRING, abilities STRING, attributes STRING, info STRING)""")
+    if table_exists(carddb, "CARDS"):
+        carddb.execute("""INSERT OR REPLACE INTO CARDS_V1
+        SELECT code, name, abilities, attributes, info FROM CARDS
+        ORDER BY rowid""")
+        carddb.execute("DROP TABLE CARDS")
+    carddb.execute("ALTER TABLE CARDS_V1 RENAME TO CARDS")
+
+
+def card_index_tables(carddb, library):
+    """
+    Version 2: Add the CARD_ATTRIBUTES, CARD_ABILITIES and CARD_INFO index
+    tables that store each attribute, ability and info value of every card
+    in its own row, and fill them from the cards already stored.
+    """
+    carddb.execute("""CREATE TABLE CARD_ATTRIBUTES(code STRING, attribute,
+    PRIMARY KEY(attribute, code)) WITHOUT ROWID""")
+    carddb.execute("""CREATE TABLE CARD_ABILITIES(code STRING, phase, value,
+    PRIMARY KEY(phase, value, code)) WITHOUT ROWID""")
+    carddb.execute("""CREATE TABLE CARD_INFO(code STRING, key, value,
+    PRIMARY KEY(key, value, code)) WITHOUT ROWID""")
+    for table in INDEX_TABLES:
+        carddb.execute("CREATE INDEX {0}_CODE ON {0}(code)".format(table))
+
+    result = carddb.execute("SELECT * FROM CARDS")
+    while True:
+        rows = result.fetchmany(500)
+        if not rows:
+            break
+        library._save_index(carddb, [library._row_card(row) for row in rows],
+                            replace=False)
+
+
+def deck_tables(carddb, library):
+    """
+    Version 3: Add the DECKS table of named decks and the DECK_CARDS table
+    storing how many of each card is in each deck, in the order each card
+    first appears in the deck.
+    """
+    carddb.execute("""CREATE TABLE DECKS(id INTEGER PRIMARY KEY,
+    name STRING UNIQUE)""")
+    carddb.execute("""CREATE TABLE DECK_CARDS(deck INTEGER, position INTEGER,
+    code STRING, count INTEGER, PRIMARY KEY(deck, position)) WITHOUT ROWID""")
+
+
+def card_changes(carddb, library):
+    """
+    Version 4: Add the CARD_CHANGES table, filled by triggers on CARDS with
+    the code of every card inserted, updated or deleted by any connection, so
+    libraries in other processes can tell which of their cached cards are
+    stale.
+    """
+    carddb.execute("""CREATE TABLE CARD_CHANGES(
+    id INTEGER PRIMARY KEY AUTOINCREMENT, code STRING)""")
+    carddb.execute("""CREATE TRIGGER CARDS_INSERTED AFTER INSERT ON CARDS
+    BEGIN INSERT INTO CARD_CHANGES(code) VALUES(NEW.code); END""")
+    carddb.execute("""CREATE TRIGGER CARDS_UPDATED AFTER UPDATE ON CARDS
+    BEGIN INSERT INTO CARD_CHANGES(code) VALUES(NEW.code);
+    INSERT INTO CARD_CHANGES(code) SELECT OLD.code WHERE OLD.code != NEW.code;
+    END""")
+    carddb.execute("""CREATE TRIGGER CARDS_DELETED AFTER DELETE ON CARDS
+    BEGIN INSERT INTO CARD_CHANGES(code) VALUES(OLD.code); END""")
+
+
+INDEX_TABLES = ("CARD_ATTRIBUTES", "CARD_ABILITIES", "CARD_INFO")
+MIGRATIONS = [cards_primary_key, card_index_tables, deck_tables,
+              card_changes]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def version(carddb):
+    """Return the schema version of the database."""
+    return carddb.execute("PRAGMA user_version").fetchone()[0]
+
+
+def upgrade(carddb, library):
+    """
+    Bring the database up to ``SCHEMA_VERSION`` by applying each pending
+    migration in ``MIGRATIONS``. Each migration is applied in its own
+    transaction, which also holds the write lock, so other connections keep
+    reading the previous schema until it commits and concurrent upgrades
+    apply each migration only once.
+
+    Returns the number of migrations that were applied.
+    """
+    applied = 0
+    while version(carddb) < SCHEMA_VERSION:
+        carddb.execute("BEGIN IMMEDIATE")
+        try:
+            current = version(carddb)
+            if current < SCHEMA_VERSION:
+                MIGRATIONS[current](carddb, library)
+                carddb.execute(
+                    "PRAGMA user_version = {0}".format(current + 1))
+                applied += 1
+        except Exception:
+            carddb.rollback()
+            raise
+        carddb.commit()
+    return applied
@@ -0,0 +1,275 @@
+"""A Library partitioned across many sqlite databases."""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+import heapq
+import threading
+import zlib
+from multiprocessing.pool import ThreadPool
+from six.moves import queue
+from .index import CardIndex
+from .library import CHUNK_SIZE, Library
+
+
+def shard_index(code, count):
+    """
+    Return the index of the shard, out of count shards, that stores the card
+    with the given code. Codes are hashed by their ``str()`` so ``1`` and
+    ``"1"`` are stored in the same shard, as they are the same code to a
+    single library.
+    """
+    return zlib.crc32(str(code).encode("utf-8")) % count
+
+
+class ShardedLibrary(object):
+    """
+    Partitions cards across a ``librarian.library.Library`` for each of the
+    given database names by a hash of their code, see ``shard_index``. Any
+    other keyword arguments are given to every shard.
+
+    A card is loaded from and saved to only the shard that stores it, while
+    many cards are loaded or saved with one query per shard and searches are
+    run on every shard, in parallel on a pool of a thread per shard, and
+    their results merged.
+
+    ShardedLibrary provides the methods of a ``Library`` that a
+    ``librarian.deck.Deck`` uses so decks can draw from it unchanged. Each
+    shard keeps its own cache, of up to ``cachelimit`` cards, while the card
+    index covers every shard.
+    """
+    def __init__(self, dbnames, **options):
+        self.shards = [Library(dbname, **options) for dbname in dbnames]
+        if not self.shards:
+            raise ValueError("ShardedLibrary needs at least one database")
+        self._card_index = None
+        self._threads = None
+        self._threads_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _pool(self):
+        """Return the thread pool, starting it if needed."""
+        with self._threads_lock:
+            if self._threads is None:
+                self._threads = ThreadPool(len(self.shards))
+            return self._threads
+
+    def _fan_out(self, func, jobs):
+        """
+        Call func with the shard and arguments of each job, a tuple of the
+        shard index and arguments, in parallel. Returns a list of the results
+        in the same order as the jobs.
+        """
+        jobs = list(jobs)
+
+        def run(job):
+            return func(self.shards[job[0]], *job[1:])
+        if len(jobs) == 1:
+            return [run(jobs[0])]
+        return self._pool().map(run, jobs)
+
+    def _group(self, items, code):
+        """
+        Return a list of the shard index and the list of items stored in
+        that shard, finding the code of each item with the code function.
+        """
+        groups = {}
+        for item in items:
+            groups.setdefault(self.shard(code(item)), []).append(item)
+        return list(groups.items())
+
+    def shard(self, code):
+        """Return the index of the shard storing the card with this code."""
+        return shard_index(code, len(self.shards))
+
+    def library(self, code):
+        """Return the shard ``Library`` storing the card with this code."""
+        return self.shards[self.shard(code)]
+
+    def close(self):
+        """Close every shard and stop the thread pool."""
+        with self._threads_lock:
+            threads, self._threads = self._threads, None
+        if threads is not None:
+            threads.close()
+            threads.join()
+        for shard in self.shards:
+            shard.close()
+
+    def create_db(self):
+        """
+        Create or upgrade every shard, see ``Library.create_db``. Returns the
+        number of schema migrations applied to all shards.
+        """
+        return sum(self._fan_out(lambda shard: shard.create_db(),
+                                 [(index,) for index in
+                                  range(len(self.shards))]))
+
+    def cached(self, code):
+        """Return True if the card with the given code is cached."""
+        return self.library(code).cached(code)
+
+    def cache_card(self, card):
+        """Cache the card in the shard that stores it."""
+        self.library(card.code).cache_card(card)
+
+    def cache_stats(self):
+        """Return the counters of the card caches of every shard combined."""
+        totals = dict(cards=0, size=0, hits=0, misses=0, evictions=0)
+        for shard in self.shards:
+            stats = shard.cache_stats()
+            for key in totals:
+                totals[key] += stats[key]
+        lookups = totals["hits"] + totals["misses"]
+        totals["ratio"] = float(totals["hits"]) / lookups if lookups else 0.0
+        return totals
+
+    def card_index(self):
+        """
+        Return a ``librarian.index.CardIndex`` of every card in every shard,
+        built the first time it is needed and kept up to date as cards are
+        saved with this library.
+        """
+        if self._card_index is None:
+            self._card_index = CardIndex(self.retrieve_all(
+                cache=False, fields=("code", "attributes", "info")))
+        return self._card_index
+
+    def load_card(self, code, cache=True, fields=None):
+        """Load a card from the shard that stores it, see ``Library``."""
+        return self.library(code).load_card(code, cache, fields)
+
+    def load_cards(self, codes, cache=True, fields=None):
+        """
+        Load the cards with each of the given codes, in the same order as the
+        codes with None for any card that could not be loaded, with a single
+        ``Library.load_cards`` call for each shard.
+        """
+        codes = list(codes)
+        found = {}
+
+        def load(shard, group):
+            return group, shard.load_cards(group, cache, fields)
+        for group, cards in self._fan_out(load, self._group(codes, str)):
+            for code, card in zip(group, cards):
+                found[str(code)] = card
+        return [found[str(code)] for code in codes]
+
+    def save_card(self, card, cache=False):
+        """Save a card to the shard that stores it."""
+        self.save_cards((card,), cache)
+
+    def save_cards(self, cards, cache=False):
+        """
+        Save all of the given cards, each shard's cards in a single
+        transaction of that shard. Returns the number of cards saved.
+        """
+        cards = list(cards)
+
+        def save(shard, group):
+            return shard.save_cards(group, cache)
+        saved = sum(self._fan_out(save, self._group(
+            cards, lambda card: card.code)))
+        if self._card_index is not None:
+            for card in cards:
+                self._card_index.add(card)
+        return saved
+
+    def filter_search(self, code=None, name=None, abilities=None,
+                      attributes=None, info=None, fields=None):
+        """
+        Search every shard like ``Library.filter_search`` and return the
+        results of each shard in turn. A search by code only searches the
+        shard that would store it.
+        """
+        arguments = (code, name, abilities, attributes, info, fields)
+        if code is not None:
+            return self.library(code).filter_search(*arguments)
+        results = []
+
+        def search(shard, *arguments):
+            return shard.filter_search(*arguments)
+        for found in self._fan_out(search, [
+                (index,) + arguments for index in range(len(self.shards))]):
+            results.extend(found)
+        return results
+
+    def text_search(self, query, limit=10):
+        """
+        Return up to limit codes and names of the best matches for the FTS5
+        query across every shard, see ``Library.text_search``. The rank of
+        matches in different shards are compared as is, which favours the
+        matches of shards holding fewer matching cards.
+        """
+        def search(shard):
+            return shard.connection().execute(
+                "SELECT rank, code, name FROM CARDS_FTS WHERE CARDS_FTS "
+                "MATCH ? ORDER BY rank LIMIT ?", (query, limit)).fetchall()
+        found = self._fan_out(search, [(index,) for index in
+                                       range(len(self.shards))])
+        return [row[1:] for row in heapq.nsmallest(
+            limit, (row for rows in found for row in rows),
+            key=lambda row: row[0])]
+
+    def retrieve_all(self, cache=True, fields=None, chunked=False,
+                     batch=CHUNK_SIZE):
+        """
+        A generator that iterates over each card in every shard, like
+        ``Library.retrieve_all``. Every shard is read at once on a thread of
+        its own, apart from the thread pool so the cards may be used with
+        other methods while iterating, and its cards produced as they are
+        read so cards from different shards are interleaved. Each shard
+        reads at most a few batches ahead of the cards produced.
+
+        The readers are joined, and so their connections closed, before this
+        generator finishes or is closed.
+        """
+        shards = len(self.shards)
+        results = queue.Queue(maxsize=shards * 2)
+        stopped = threading.Event()
+        done = object()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read(shard):
+            try:
+                for cards in shard.retrieve_all(cache, fields, True, batch):
+                    if not put(cards):
+                        return
+            except Exception as error:
+                put(error)
+            put(done)
+
+        readers = []
+        for shard in self.shards:
+            reader = threading.Thread(target=read, args=(shard,))
+            reader.daemon = True
+            reader.start()
+            readers.append(reader)
+        try:
+            finished = 0
+            while finished < shards:
+                cards = results.get()
+                if cards is done:
+                    finished += 1
+                elif isinstance(cards, Exception):
+                    raise cards
+                elif chunked:
+                    yield cards
+                else:
+                    for card in cards:
+                        yield card
+        finally:
+            stopped.set()
+            for reader in readers:
+                reader.join()
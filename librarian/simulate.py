@@ -0,0 +1,96 @@
+"""Monte Carlo simulation of drawing hands from a deck."""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+import math
+import multiprocessing
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+BATCH_SIZE = 10000
+_worker = {}
+
+
+def _init_worker(features, hand_size, predicate):
+    """Store the simulation shared by every batch run in this process."""
+    _worker.update(features=features, hand_size=hand_size,
+                   predicate=predicate)
+
+
+def _hands(size, hand_size, count, seed, batch):
+    """
+    Generate count hands of hand_size random positions in a deck of the
+    given size. The hands only depend on the seed and batch number.
+    """
+    if numpy is not None:
+        rng = numpy.random.default_rng([seed, batch])
+        keys = rng.random((count, size))
+        return keys.argpartition(hand_size - 1, axis=1)[:, :hand_size]
+    rng = random.Random("{0}:{1}".format(seed, batch))
+    positions = range(size)
+    return (rng.sample(positions, hand_size) for _ in range(count))
+
+
+def _run_batch(job):
+    """Return how many hands of a batch satisfy the predicate."""
+    seed, batch, count = job
+    features = _worker["features"]
+    predicate = _worker["predicate"]
+    successes = 0
+    for hand in _hands(len(features), _worker["hand_size"], count, seed,
+                       batch):
+        if predicate([features[position] for position in hand]):
+            successes += 1
+    return successes
+
+
+def simulate(features, trials, hand_size, predicate, seed=None,
+             processes=None, batch=BATCH_SIZE):
+    """
+    Estimate the probability that a random hand of hand_size cards from a
+    deck satisfies the predicate, using the given number of trials.
+
+    features should be a list with a value for each card in the deck and the
+    predicate is called with a list of the values of the cards in each hand.
+
+    Trials are run in batches of ``batch`` hands, each seeded from the seed
+    and its batch number, so the same seed gives the same result however the
+    batches are spread over processes. If seed is None a random seed is used
+    and returned with the results. The hands are generated with numpy when it
+    is installed, which gives different results for the same seed then
+    without it.
+
+    The batches are spread over a pool of processes, which defaults to one
+    per cpu, in which case the predicate and features must be picklable. If
+    processes is 1 every batch is run in this process.
+
+    Returns a dict of the number of trials and successes, the estimated
+    probability, its standard error and the seed.
+    """
+    if not 0 < hand_size <= len(features):
+        raise ValueError("hand_size must be between 1 and the deck size")
+    if seed is None:
+        seed = random.getrandbits(64)
+
+    jobs = [(seed, number, min(batch, trials - start))
+            for number, start in enumerate(range(0, trials, batch))]
+    initargs = (list(features), hand_size, predicate)
+    if processes == 1 or len(jobs) <= 1:
+        _init_worker(*initargs)
+        successes = sum(map(_run_batch, jobs))
+    else:
+        pool = multiprocessing.Pool(processes, _init_worker, initargs)
+        try:
+            successes = sum(pool.imap_unordered(_run_batch, jobs))
+        finally:
+            pool.close()
+            pool.join()
+
+    probability = float(successes) / trials if trials else 0.0
+    return dict(trials=trials, successes=successes, probability=probability,
+                stderr=math.sqrt(probability * (1 - probability) / trials)
+                if trials else 0.0, seed=seed)
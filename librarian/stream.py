@@ -0,0 +1,152 @@
+"""Streaming import and export of card sets as CSV or JSON Lines."""
+__author__ = 'Taylor "Nekroze" Lawson'
+__email__ = 'nekroze@eturnilnetwork.com'
+import csv
+import io
+import multiprocessing
+import time
+from collections import deque
+from itertools import islice
+from six import string_types
+from .codec import JSONCodec
+
+
+FORMATS = ("jsonl", "csv")
+COLUMNS = ("code", "name", "abilities", "attributes", "info")
+BATCH_SIZE = 5000
+EMPTY = {"abilities": dict, "attributes": list, "info": dict}
+CODEC = JSONCodec()
+
+
+def check_format(format):
+    """Raise a ValueError if the given stream format is not supported."""
+    if format not in FORMATS:
+        raise ValueError("Unknown stream format {0}, expected {1}".format(
+            format, " or ".join(FORMATS)))
+
+
+def open_stream(source, mode):
+    """
+    Return the given file object as is, or open the given path as a text
+    file for use with ``csv``, along with whether it was opened here.
+    """
+    if isinstance(source, string_types):
+        return io.open(source, mode, encoding="utf-8", newline=""), True
+    return source, False
+
+
+def read_records(source, format):
+    """
+    Iterate over the unparsed records of a card set, the lines of a JSON
+    Lines stream or a dict of the columns of each row of a CSV stream. The
+    source may be a file object or any iterable of lines.
+    """
+    if format == "csv":
+        return csv.DictReader(source)
+    return (line for line in source if line.strip())
+
+
+def parse_records(format, records):
+    """
+    Parse a list of records produced by ``read_records`` into a list of
+    carddicts as produced by ``Card.save``.
+
+    In CSV records the abilities, attributes and info columns hold JSON in
+    the form written by ``librarian.codec.JSONCodec``, missing columns are
+    left empty.
+    """
+    if format == "jsonl":
+        return [CODEC.loads(line) for line in records]
+    carddicts = []
+    for record in records:
+        carddict = dict(code=record["code"], name=record.get("name") or "")
+        for key, empty in EMPTY.items():
+            value = record.get(key)
+            carddict[key] = CODEC.loads(value) if value else empty()
+        carddicts.append(carddict)
+    return carddicts
+
+
+def _parse_job(job):
+    """Parse a chunk of records in a worker process."""
+    return parse_records(*job)
+
+
+def parse_stream(records, format, batch=BATCH_SIZE, processes=None):
+    """
+    Iterate over lists of up to ``batch`` carddicts parsed from the given
+    records in order.
+
+    If ``processes`` is more then 1 the chunks are parsed on a pool of that
+    many processes. At most two chunks per process are read ahead of the
+    chunks produced so memory use is bounded however large the stream is.
+    """
+    records = iter(records)
+
+    def chunks():
+        while True:
+            chunk = list(islice(records, batch))
+            if not chunk:
+                return
+            yield chunk
+
+    if processes is None or processes <= 1:
+        for chunk in chunks():
+            yield parse_records(format, chunk)
+        return
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        pending = deque()
+        for chunk in chunks():
+            pending.append(pool.apply_async(_parse_job, ((format, chunk),)))
+            if len(pending) >= processes * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def format_carddict(format, carddict):
+    """
+    Return a carddict as a line of JSON Lines or as a dict of the columns of
+    a CSV row.
+    """
+    if format == "jsonl":
+        return CODEC.dumps(carddict) + "\n"
+    row = dict(code=carddict["code"], name=carddict["name"])
+    for key in EMPTY:
+        row[key] = CODEC.dumps(carddict[key])
+    return row
+
+
+def progress_report(count, start):
+    """
+    Return a dict of the number of cards handled, the seconds since start
+    and the cards handled per second.
+    """
+    seconds = time.time() - start
+    return dict(cards=count, seconds=seconds,
+                rate=count / seconds if seconds else 0.0)
+
+
+def write_stream(destination, format, chunks):
+    """
+    Write lists of carddicts to the given file object in the given format,
+    along with a header row for CSV. Generates the number of cards in each
+    list as it is written.
+    """
+    if format == "csv":
+        writer = csv.DictWriter(destination, COLUMNS)
+        writer.writeheader()
+        for carddicts in chunks:
+            writer.writerows(format_carddict(format, carddict)
+                             for carddict in carddicts)
+            yield len(carddicts)
+    else:
+        for carddicts in chunks:
+            destination.writelines(format_carddict(format, carddict)
+                                   for carddict in carddicts)
+            yield len(carddicts)
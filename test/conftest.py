@@ -0,0 +1,10 @@
+"""
+Configuration of the tests of librarian.
+"""
+import sys
+
+
+collect_ignore = []
+if sys.version_info < (3, 7):
+    # AsyncLibrary uses async syntax and asyncio functions added in 3.7.
+    collect_ignore.append("test_aio.py")
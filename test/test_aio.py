@@ -0,0 +1,95 @@
+"""
+Tests for `librarian.aio` module.
+"""
+import asyncio
+import pytest
+from librarian.aio import AsyncLibrary
+from librarian.card import Card
+from librarian.library import Library
+
+
+@pytest.fixture
+def library(tmpdir):
+    library = Library(str(tmpdir.join("cards.db")))
+    library.save_cards([Card(code, 'Card {0}'.format(code))
+                        for code in range(1, 6)])
+    yield library
+    library.close()
+
+
+class TestAsyncLibrary(object):
+
+    def test_load_card(self, library):
+        async def scenario():
+            async with AsyncLibrary(library) as alibrary:
+                card = await alibrary.load_card(1)
+                missing = await alibrary.load_card(404)
+                return card, missing
+
+        card, missing = asyncio.run(scenario())
+        assert card.name == 'Card 1'
+        assert missing is None
+        assert library.cached(1)
+
+    def test_coalesce(self, library, monkeypatch):
+        queries = []
+        select = library._select_cards
+
+        def counted(codes):
+            queries.append(list(codes))
+            return select(codes)
+        monkeypatch.setattr(library, "_select_cards", counted)
+
+        async def scenario():
+            alibrary = AsyncLibrary(library)
+            cards = await asyncio.gather(*[alibrary.load_card(code) for code
+                                           in (1, 1, 2, 1)])
+            cards.append(await alibrary.load_card(1))
+            await alibrary.close()
+            return cards
+
+        cards = asyncio.run(scenario())
+        assert [card.code for card in cards] == [1, 1, 2, 1, 1]
+        assert cards[0] is cards[1] is cards[4]
+        assert queries == [['1'], ['2']]
+
+    def test_load_cards(self, library):
+        library.load_card(2)
+
+        async def scenario():
+            async with AsyncLibrary(library) as alibrary:
+                return await alibrary.load_cards([3, 2, 404, 3])
+
+        cards = asyncio.run(scenario())
+        assert [card.code if card else None for card in cards] == \
+            [3, 2, None, 3]
+
+    def test_save_search(self, library):
+        async def scenario():
+            async with AsyncLibrary(library) as alibrary:
+                card = Card(9, 'Fire Ant')
+                card.add_attribute('insect')
+                await alibrary.save_card(card)
+                await alibrary.save_cards([Card(10, 'Ice Ant')])
+                return (await alibrary.filter_search(attributes=['insect']),
+                        await alibrary.filter_search(name='Ant'))
+
+        insects, ants = asyncio.run(scenario())
+        assert insects == [(9, 'Fire Ant')]
+        assert len(ants) == 2
+
+    def test_changes_invalidate(self, library):
+        worker = Library(library.dbname, coherence=0)
+        worker.load_cards([1, 2])
+        library.save_card(Card(1, 'Fire Ant Queen'))
+
+        async def scenario():
+            async with AsyncLibrary(worker) as alibrary:
+                card = await alibrary.load_card(1)
+                library.save_card(Card(2, 'Wisp'))
+                cards = await alibrary.load_cards([2])
+                return card, cards[0]
+
+        card, other = asyncio.run(scenario())
+        assert card.name == 'Fire Ant Queen'
+        assert other.name == 'Wisp'
@@ -0,0 +1,25 @@
+"""
+Tests for the `benchmarks.suite` module.
+"""
+from benchmarks.suite import compare, generate_cards, run
+
+
+class TestBenchmarks(object):
+
+    def test_generate_cards(self):
+        first = [card.save() for card in generate_cards(20, seed=1)]
+        second = [card.save() for card in generate_cards(20, seed=1)]
+
+        assert len(first) == 20
+        assert first == second
+
+    def test_run(self, tmpdir):
+        results = run(sizes=[50], repeat=10, directory=str(tmpdir))
+        cases = set(result["case"] for result in results["results"])
+
+        assert "load_card_miss" in cases
+        assert "filter_search_info" in cases
+        assert "deck_attribute_histogram" in cases
+        assert all(result["size"] == 50 for result in results["results"])
+        assert [ratio[2] for ratio in compare(results, results)
+                if ratio[2] != 1.0] == []
@@ -0,0 +1,140 @@
+"""
+Tests for `librarian.cache` module.
+"""
+import pytest
+from librarian.cache import CardCache, NegativeCache, estimate_card_size
+from librarian.card import Card, LazyCard
+
+
+class TestCardCache(object):
+
+    def test_get_put(self):
+        cache = CardCache()
+        card = Card(1, 'Test')
+        cache.put(card)
+
+        assert 1 in cache
+        assert cache.get(1) is card
+        assert cache.get(2) is None
+
+    def test_string_codes(self):
+        cache = CardCache()
+        card = Card(1, 'Test')
+        cache.put(card)
+
+        assert '1' in cache
+        assert cache.get('1') is card
+        cache.put(Card('1', 'Other'))
+        assert len(cache) == 1
+        cache.discard('1')
+        assert 1 not in cache
+
+    def test_limit(self):
+        cache = CardCache(limit=2)
+        cache.put(Card(1))
+        cache.put(Card(2))
+        cache.get(1)
+        cache.put(Card(3))
+
+        assert 1 in cache
+        assert 2 not in cache
+        assert 3 in cache
+        assert len(cache) == 2
+
+    def test_maxsize(self):
+        card = Card(1, 'Test')
+        cache = CardCache(limit=100, maxsize=estimate_card_size(card) * 2)
+        for code in range(1, 5):
+            cache.put(Card(code, 'Test'))
+
+        assert len(cache) == 2
+        assert cache.size <= cache.maxsize
+        assert 4 in cache
+
+    def test_lazy_size(self):
+        encoded = '["{0}"]'.format('red' * 100)
+        card = LazyCard(1, 'Test', encoded=dict(attributes=encoded),
+                        decode=lambda field, data: ['red'])
+        size = estimate_card_size(card)
+
+        assert not card.decoded()
+        assert size > estimate_card_size(LazyCard(1, 'Test')) + 200
+
+    def test_resize(self):
+        cache = CardCache(limit=10, maxsize=10 ** 6)
+        big = LazyCard(1, 'Test', encoded=dict(attributes='[]'),
+                       decode=lambda field, data: ['red' * 1000],
+                       on_decode=cache.resize)
+        cache.put(Card(2, 'Test'))
+        cache.put(big)
+        size = cache.size
+        big.attributes
+
+        assert cache.size > size + 2000
+        cache.maxsize = cache.size - 1
+        cache.resize(big)
+        assert 2 not in cache
+        assert 1 in cache
+        cache.resize(Card(3))
+        assert 3 not in cache
+
+    def test_replace(self):
+        cache = CardCache(limit=2, maxsize=10 ** 6)
+        cache.put(Card(1))
+        size = cache.size
+        cache.put(Card(1))
+
+        assert len(cache) == 1
+        assert cache.size == size
+
+    def test_stats(self):
+        cache = CardCache(limit=1)
+        cache.put(Card(1))
+        cache.get(1)
+        cache.get(2)
+        cache.put(Card(2))
+        stats = cache.stats()
+
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["evictions"] == 1
+        assert stats["ratio"] == pytest.approx(0.5)
+
+    def test_discard_clear(self):
+        cache = CardCache()
+        cache.put(Card(1))
+        cache.put(Card(2))
+        cache.discard(1)
+
+        assert 1 not in cache
+        cache.clear()
+        assert len(cache) == 0
+
+
+class TestNegativeCache(object):
+
+    def test_ttl(self):
+        now = [0]
+        cache = NegativeCache(ttl=10, clock=lambda: now[0])
+        cache.add('1')
+
+        assert '1' in cache
+        assert '2' not in cache
+        now[0] = 10
+        assert '1' not in cache
+        assert len(cache) == 0
+
+    def test_limit(self):
+        cache = NegativeCache(limit=2)
+        for code in '123':
+            cache.add(code)
+
+        assert '1' not in cache
+        assert '3' in cache
+
+    def test_discard(self):
+        cache = NegativeCache()
+        cache.add('1')
+        cache.discard('1')
+
+        assert '1' not in cache
@@ -2,7 +2,7 @@
 Tests for `librarian.card` module.
 """
 import pytest
-from librarian.card import Card
+from librarian.card import Card, CompactCard, LazyCard
 
 
 class TestCard(object):
@@ -97,3 +97,108 @@ class TestCard(object):
         card = Card(12345)
 
         assert repr(card) == '<Card:12345>'
+
+    def test_hash(self):
+        assert hash(Card(1)) == hash(Card(1, 'Other'))
+        assert len(set([Card(1), Card(1), Card(2)])) == 2
+
+
+class TestCompactCard(object):
+
+    def test_constructor(self):
+        card = CompactCard(1, 'Test')
+
+        assert card.code == 1
+        assert card.name == 'Test'
+        assert card.attributes == frozenset()
+
+    def test_slots(self):
+        card = CompactCard(1)
+
+        assert not hasattr(card, '__dict__')
+        with pytest.raises(AttributeError):
+            card.nmae = 'Typo'
+        assert card == Card(1)
+        assert not isinstance(card, Card)
+
+    def test_attributes(self):
+        card = CompactCard()
+
+        assert card.add_attribute('test') == 1
+        assert card.add_attribute('test') == 1
+        assert card.add_attribute('other') == 2
+        assert card.has_attribute('test') is True
+        assert card.has_attribute('card') is False
+
+    def test_shared_attributes(self):
+        first = CompactCard(1)
+        second = CompactCard(2)
+        for card in (first, second):
+            card.add_attribute('red')
+            card.add_attribute(''.join(['bi', 'g']))
+
+        assert first.attributes is second.attributes
+
+    def test_abilities_info(self):
+        card = CompactCard()
+        card.add_ability('attack', 'Slap')
+
+        assert card.add_ability('attack', 'Facepalm') == 2
+        assert card.get_abilities('attack') == ('Slap', 'Facepalm')
+        card.set_info('art', 1)
+        card.set_info('art', 2)
+        assert card.get_info('art') == [1, 2]
+
+    def test_save_load(self):
+        original = Card(1, 'Test')
+        original.add_ability('attack', 'Slap')
+        original.add_attribute('b')
+        original.add_attribute('a')
+        original.set_info('art', 'x')
+        loaded = CompactCard(loaddict=original.save())
+
+        assert loaded == original
+        assert hash(loaded) == hash(original)
+        assert loaded.attributes == frozenset(['a', 'b'])
+        assert loaded.get_abilities('attack') == ('Slap',)
+        assert loaded.get_info('art') == ['x']
+        assert loaded.save() == dict(original.save(), attributes=['a', 'b'])
+        assert loaded.name is CompactCard(loaddict=original.save()).name
+
+    def test_representation(self):
+        assert repr(CompactCard(12345)) == '<CompactCard:12345>'
+
+
+class TestLazyCard(object):
+
+    def test_decodes_on_access(self):
+        decoded = []
+
+        def decode(field, data):
+            decoded.append(field)
+            return data.split(',') if field == 'attributes' else {}
+        card = LazyCard(1, 'Lazy', encoded=dict(
+            abilities='', attributes='red,big', info=''), decode=decode)
+
+        assert card.name == 'Lazy'
+        assert decoded == []
+        assert card.has_attribute('big')
+        assert card.attributes == ['red', 'big']
+        assert decoded == ['attributes']
+        assert not card.decoded()
+        assert card.save()['info'] == {}
+        assert card.decoded()
+
+    def test_set_replaces_data(self):
+        card = LazyCard(1, 'Lazy', encoded=dict(info='x'), decode=None)
+        card.info = {'cost': 3}
+
+        assert card.info == {'cost': 3}
+        assert card.decoded()
+
+    def test_eager(self):
+        card = LazyCard(1, 'Eager')
+        card.add_attribute('test')
+
+        assert card.decoded()
+        assert LazyCard(loaddict=card.save()).attributes == ['test']
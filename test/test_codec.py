@@ -0,0 +1,49 @@
+"""
+Tests for `librarian.codec` module.
+"""
+import pytest
+from librarian import codec
+from librarian.codec import JSONCodec, MsgpackCodec, decode, lookup
+
+VALUES = [
+    {},
+    [],
+    ['test', 1, 2.5, None],
+    {'attack': ['Slap'], 'art': [1, 2]},
+    {1: ['Facepalm'], (2, 'b'): {'nested': [1]}},
+]
+
+
+class TestCodec(object):
+
+    @pytest.mark.parametrize("value", VALUES)
+    def test_json_roundtrip(self, value):
+        json = JSONCodec()
+        data = json.encode(value)
+
+        assert data.startswith("j1:")
+        assert lookup(data) is not None
+        assert decode(data) == value
+
+    @pytest.mark.parametrize("value", VALUES)
+    def test_msgpack_roundtrip(self, value):
+        pytest.importorskip("msgpack")
+        data = MsgpackCodec().encode(value)
+
+        assert data.startswith(b"m1:")
+        assert decode(data) == value
+
+    def test_legacy(self):
+        value = {'attack': ['Slap'], 1: [2]}
+
+        assert lookup(str(value)) is None
+        assert decode(str(value)) == value
+
+    def test_legacy_not_evaluated(self):
+        with pytest.raises(ValueError):
+            decode("__import__('os').getcwd()")
+
+    def test_msgpack_missing(self, monkeypatch):
+        monkeypatch.setattr(codec, "msgpack", None)
+        with pytest.raises(ImportError):
+            MsgpackCodec()
@@ -0,0 +1,111 @@
+"""
+Tests for `librarian.compression` module.
+"""
+import pytest
+from librarian.card import Card
+from librarian.compression import Compressor, decompress, lzma
+from librarian.library import Library
+
+
+TEXT = "j1:" + '{"text":"' + "Deal one damage to target creature. " * 20 + '"}'
+
+
+def rulings_card(code):
+    card = Card(code, 'Ruler {0}'.format(code))
+    card.add_ability('upkeep', 'Draw a card. ' * 40)
+    card.set_info('rulings', ['Ruling {0} applies.'.format(number)
+                              for number in range(30)])
+    card.set_info('cost', 2, False)
+    return card
+
+
+class TestCompressor(object):
+
+    def test_text(self):
+        compressor = Compressor()
+        data = compressor.compress('info', TEXT)
+
+        assert data.startswith(b'zlib1:t')
+        assert len(data) < len(TEXT)
+        assert decompress('info', data) == TEXT
+
+    def test_bytes(self):
+        compressor = Compressor()
+        raw = TEXT.encode('utf-8')
+
+        assert decompress('info', compressor.compress('info', raw)) == raw
+
+    def test_thresholds(self):
+        compressor = Compressor(thresholds={'info': 10000})
+
+        assert compressor.compress('info', TEXT) == TEXT
+        assert compressor.compress('abilities', TEXT) == TEXT
+        assert compressor.compress('attributes', TEXT) == TEXT
+
+    def test_incompressible(self):
+        compressor = Compressor(thresholds={'info': 1})
+
+        assert compressor.compress('info', 'j1:{}') == 'j1:{}'
+
+    @pytest.mark.skipif(lzma is None, reason="requires lzma")
+    def test_lzma(self):
+        data = Compressor('lzma').compress('info', TEXT)
+
+        assert data.startswith(b'lzma1:t')
+        assert decompress('info', data) == TEXT
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            Compressor('brotli')
+
+
+class TestLibraryHooks(object):
+
+    def test_chain_order(self, tmpdir):
+        library = Library(str(tmpdir.join('order.db')))
+        calls = []
+        library.add_hooks(lambda field, data: calls.append('save1') or data,
+                          lambda field, data: calls.append('load1') or data)
+        library.add_hooks(lambda field, data: calls.append('save2') or data,
+                          lambda field, data: calls.append('load2') or data)
+        library.create_db()
+        library.save_card(Card(1, 'Ant'))
+        del calls[:]
+        library.load_card(1)
+        library.close()
+
+        assert calls == ['load2', 'load1'] * 3
+
+    def test_compressed_library(self, tmpdir):
+        library = Library(str(tmpdir.join('compressed.db')))
+        compressor = Compressor()
+        library.add_hooks(compressor.compress, compressor.decompress)
+        library.create_db()
+        card = rulings_card(1)
+        library.save_card(card)
+        stored = library.connection().execute(
+            "SELECT abilities, attributes, info FROM CARDS").fetchone()
+
+        assert stored[0].startswith(b'zlib1:')
+        assert stored[1] == 'j1:[]'
+        assert stored[2].startswith(b'zlib1:')
+        assert library.load_card(1, cache=False) == card
+        assert list(library.retrieve_all(fields=['info']))[0]['info'] == \
+            card.info
+        assert library.filter_search(info={'cost': 2}) == [(1, 'Ruler 1')]
+        library.close()
+
+    def test_migrate(self, tmpdir):
+        dbname = str(tmpdir.join('migrate.db'))
+        with Library(dbname) as library:
+            library.create_db()
+            library.save_cards([rulings_card(1), Card(2, 'Ant')])
+
+        library = Library(dbname)
+        compressor = Compressor()
+        library.add_hooks(compressor.compress, compressor.decompress)
+
+        assert library.migrate_codec() == 1
+        assert library.migrate_codec() == 0
+        assert library.load_card(1, cache=False) == rulings_card(1)
+        library.close()
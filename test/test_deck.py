@@ -0,0 +1,154 @@
+"""
+Tests for `librarian.deck` module.
+"""
+import random
+import sys
+import pytest
+from librarian.card import Card
+from librarian.deck import Deck
+from librarian.library import Library
+
+
+@pytest.fixture
+def library(tmpdir):
+    library = Library(str(tmpdir.join("cards.db")))
+    library.create_db()
+    for code in range(1, 6):
+        card = Card(code, 'Card {0}'.format(code))
+        if code % 2:
+            card.add_attribute('odd')
+        card.set_info('cost', code, False)
+        library.save_card(card)
+    yield library
+    library.close()
+
+
+class TestDeck(object):
+
+    def test_top_cards(self):
+        deck = Deck(cards=[1, 2, 3, 4])
+
+        assert deck.top_cards(2) == [4, 3]
+        assert deck.cards == [1, 2]
+        assert deck.top_cards(5, remove=False) == [2, 1]
+        assert deck.top_cards(0) == []
+
+    def test_top_cards_compact(self):
+        deck = Deck(cards=[1, 2, 3, 4], compact=True)
+
+        assert deck.compact
+        assert deck.top_cards(2) == [4, 3]
+        assert list(deck.cards) == [1, 2]
+
+    def test_get_card(self):
+        deck = Deck(cards=[1, 2, 3])
+
+        assert deck.get_card(remove=False) == 3
+        assert deck.get_card(0) == 1
+        assert deck.get_card(5) is None
+        assert deck.get_card(-5) is None
+        assert deck.cards == [2, 3]
+
+    def test_shuffle(self):
+        first = Deck(cards=list(range(50)), rng=random.Random(1))
+        second = Deck(cards=list(range(50)), compact=True,
+                      rng=random.Random(1))
+        first.shuffle()
+        second.shuffle()
+
+        assert first.cards is not None
+        assert sorted(first.cards) == list(range(50))
+        assert list(second.cards) == first.cards
+
+    def test_peek(self):
+        deck = Deck(cards=[1, 2, 3])
+        compact = Deck(cards=[1, 2, 3], compact=True)
+
+        assert deck.peek(2) == [3, 2]
+        assert isinstance(compact.peek(2), memoryview)
+        assert compact.peek(2).tolist() == [3, 2]
+        assert deck.remaining() == 3
+
+    def test_peek_without_memoryview(self, monkeypatch):
+        def unsupported(obj):
+            raise TypeError("cannot make memory view")
+        monkeypatch.setattr('librarian.deck.memoryview', unsupported,
+                            raising=False)
+        compact = Deck(cards=[1, 2, 3], compact=True)
+
+        assert compact.peek(2).tolist() == [3, 2]
+
+    @pytest.mark.parametrize("compact", [False, True])
+    def test_move_top_cards(self, compact):
+        deck = Deck(cards=[1, 2, 3, 4], compact=compact)
+        other = Deck(cards=[9], compact=compact)
+        deck.move_top_cards(other, 2)
+
+        assert list(deck.cards) == [1, 2]
+        assert list(other.cards) == [9, 4, 3]
+
+    def test_compact_memory(self):
+        codes = list(range(1000, 1060))
+        deck = Deck(cards=codes, compact=True)
+
+        assert sys.getsizeof(deck.cards) < sys.getsizeof(codes) + sum(
+            sys.getsizeof(code) for code in codes)
+
+    def test_top_cards_library(self, library):
+        deck = Deck(library, [1, 2, 3])
+        cards = deck.top_cards(2)
+
+        assert [card.code for card in cards] == [3, 2]
+        assert deck.cards == [1]
+
+    def test_contains_attribute(self, library):
+        deck = Deck(library, [1, 2, 3, 3])
+
+        assert deck.contians_attribute('odd') == 3
+        assert Deck(cards=[1]).contians_attribute('odd') == 0
+
+    def test_contains_info(self, library):
+        deck = Deck(library, [1, 2, 2, 5])
+
+        assert deck.contains_info('cost', 2) == 2
+        assert deck.contains_info('art', None) == 4
+
+    def test_attribute_histogram(self, library):
+        deck = Deck(library, [1, 2, 3, 3], compact=True)
+
+        assert deck.attribute_histogram() == {'odd': 3}
+        assert deck.attribute_histogram(['odd', 'even']) == \
+            {'odd': 3, 'even': 0}
+        assert Deck(cards=[1]).attribute_histogram() == {}
+
+    def test_string_codes(self, library):
+        deck = Deck(library, ['1', '1', 2, '3'])
+
+        assert deck.contians_attribute('odd') == 3
+        assert deck.contains_info('cost', 1) == 2
+        assert deck.attribute_histogram() == {'odd': 3}
+
+    def test_counts_follow_saves(self, library):
+        deck = Deck(library, [1, 2])
+        assert deck.contians_attribute('odd') == 1
+
+        card = library.load_card(2)
+        card.add_attribute('odd')
+        library.save_card(card)
+        assert deck.contians_attribute('odd') == 2
+        assert len(library.card_cache) == 1
+
+    def test_simulate(self, library):
+        deck = Deck(library, [1, 2, 2, 2])
+        result = deck.simulate(2000, 2, lambda hand: 'Card 1' in hand,
+                               seed=1, features=lambda card: card.name,
+                               processes=1)
+
+        assert result["probability"] == pytest.approx(0.5, abs=0.05)
+
+    def test_simulate_codes(self):
+        deck = Deck(cards=[1, 2, 3, 4], compact=True)
+        result = deck.simulate(100, 4, lambda hand: len(set(hand)) == 4,
+                               processes=1)
+
+        assert result["successes"] == 100
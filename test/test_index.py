@@ -0,0 +1,42 @@
+"""
+Tests for `librarian.index` module.
+"""
+from librarian.card import Card
+from librarian.index import CardIndex
+
+
+def make_card(code, attributes, **info):
+    card = Card(code, 'Test')
+    card.attributes = list(attributes)
+    card.info = info
+    return card
+
+
+class TestCardIndex(object):
+
+    def test_add(self):
+        index = CardIndex([make_card(1, ['red'], cost=1),
+                           dict(code=2, attributes=['red', 'big'],
+                                info={'cost': 2})])
+
+        assert len(index) == 2
+        assert index.attribute_codes('red') == set(['1', '2'])
+        assert index.attribute_codes('blue') == set()
+        assert index.info_values('cost') == {'1': 1, '2': 2}
+        assert index.card_attributes['2'] == ('red', 'big')
+        assert 2 in index and '2' in index
+
+    def test_replace(self):
+        index = CardIndex([make_card(1, ['red'], cost=1)])
+        index.add(make_card(1, ['blue']))
+
+        assert index.attribute_codes('red') == set()
+        assert index.attribute_codes('blue') == set(['1'])
+        assert index.info_values('cost') == {}
+
+    def test_discard(self):
+        index = CardIndex([make_card(1, ['red'], cost=1)])
+        index.discard('1')
+
+        assert 1 not in index
+        assert index.attribute_codes('red') == set()
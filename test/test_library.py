@@ -0,0 +1,626 @@
+"""
+Tests for `librarian.library` module.
+"""
+import sqlite3
+import threading
+import pytest
+from librarian.cache import NegativeCache
+from librarian.card import Card, CompactCard, LazyCard
+from librarian.deck import Deck
+from librarian.library import Library, Where_filter_gen
+from librarian.membership import BloomFilter
+
+
+@pytest.fixture
+def library(tmpdir):
+    library = Library(str(tmpdir.join("cards.db")))
+    library.create_db()
+    yield library
+    library.close()
+
+
+@pytest.fixture
+def searchable(library):
+    first = Card(1, 'Fire Ant')
+    first.add_attribute('insect')
+    first.add_attribute('red')
+    first.add_ability('attack', 'Bite')
+    first.set_info('cost', 1)
+    second = Card(2, 'Ice 100% Ant')
+    second.add_attribute('insect')
+    second.add_ability('attack', 'Freeze')
+    second.add_ability(3, 'Thaw')
+    second.set_info('cost', 2)
+    third = Card(3, 'Fire Drake')
+    third.add_attribute('red')
+    third.set_info('rarity', 'rare', False)
+    library.save_cards([first, second, third])
+    return library
+
+
+class TestFilter(object):
+
+    def test_empty(self):
+        assert Where_filter_gen(("code", None), ("name", None)) == ("", [])
+
+    def test_parameters(self):
+        where, params = Where_filter_gen(("code", 1), ("attributes", ['a']))
+
+        assert where.startswith("WHERE code = ? AND code IN")
+        assert params == [1, 'a']
+
+    def test_search(self, searchable):
+        def codes(**kwargs):
+            return sorted(row[0] for row in searchable.filter_search(**kwargs))
+
+        assert codes() == [1, 2, 3]
+        assert codes(code=2) == [2]
+        assert codes(name='Fire') == [1, 3]
+        assert codes(name='100%') == [2]
+        assert codes(name='_') == []
+        assert codes(attributes=['insect']) == [1, 2]
+        assert codes(attributes=['insect', 'red']) == [1]
+        assert codes(abilities={'attack': '*'}) == [1, 2]
+        assert codes(abilities={'attack': ['Bite']}) == [1]
+        assert codes(abilities={3: '*'}) == [2]
+        assert codes(info={'cost': [2]}) == [2]
+        assert codes(info={'rarity': 'rare'}) == [3]
+        assert codes(name='Ant', info={'cost': '*'},
+                     attributes=['red']) == [1]
+
+    def test_search_resave(self, searchable):
+        card = searchable.load_card(1)
+        card.attributes = ['blue']
+        searchable.save_card(card)
+
+        assert searchable.filter_search(attributes=['red']) == \
+            [(3, 'Fire Drake')]
+
+    def test_search_uses_index(self, searchable):
+        where, params = Where_filter_gen(("attributes", ['red']))
+        plan = searchable.connection().execute(
+            "EXPLAIN QUERY PLAN SELECT code FROM CARDS " + where, params)
+
+        assert "CARD_ATTRIBUTES USING PRIMARY KEY" in " ".join(
+            str(row) for row in plan)
+
+
+class TestTextSearch(object):
+
+    @pytest.fixture
+    def library(self, tmpdir):
+        library = Library(str(tmpdir.join("cards.db")), fulltext=True,
+                          fulltext_info=('text',))
+        yield library
+        library.close()
+
+    def test_text_search(self, library):
+        first = Card(1, 'Fire Ant')
+        first.add_ability('attack', 'Bite the defender')
+        first.set_info('text', 'Burns brightly')
+        first.set_info('art', 'ignored')
+        second = Card(2, 'Fire Drake')
+        second.add_ability('attack', 'Breathe fire on fire ants')
+        library.save_cards([first, second])
+
+        assert [row[0] for row in library.text_search('fire')] == [2, 1]
+        assert library.text_search('bite') == [(1, 'Fire Ant')]
+        assert library.text_search('burn*') == [(1, 'Fire Ant')]
+        assert library.text_search('ignored') == []
+        assert len(library.text_search('fire', limit=1)) == 1
+
+    @pytest.mark.parametrize('upsert', [True, False])
+    def test_text_search_resave(self, library, monkeypatch, upsert):
+        monkeypatch.setattr('librarian.library.UPSERT', upsert)
+        library.save_card(Card(1, 'Fire Ant'))
+        library.save_card(Card(1, 'Ice Ant'))
+
+        assert library.text_search('fire') == []
+        assert library.text_search('ant') == [(1, 'Ice Ant')]
+
+    def test_rebuild(self, tmpdir):
+        dbname = str(tmpdir.join("cards.db"))
+        with Library(dbname) as library:
+            library.save_card(Card(1, 'Fire Ant'))
+
+        with Library(dbname, fulltext=True) as library:
+            assert library.text_search('ant') == [(1, 'Fire Ant')]
+
+
+class TestLibrary(object):
+
+    def test_save_load(self, library):
+        original = Card(1, 'Test')
+        original.add_attribute('test')
+        library.save_card(original)
+        loaded = library.load_card(1, cache=False)
+
+        assert loaded == original
+        assert loaded.name == 'Test'
+        assert loaded.attributes == ['test']
+
+    @pytest.mark.parametrize('upsert', [True, False])
+    def test_save_in_place(self, library, monkeypatch, upsert):
+        monkeypatch.setattr('librarian.library.UPSERT', upsert)
+        library.save_cards([Card(code, 'Test') for code in range(1, 4)])
+        rowid = library.connection().execute(
+            "SELECT rowid FROM CARDS WHERE code = 2").fetchone()
+        library.save_cards([Card(2, 'Changed'), Card(4, 'New')])
+
+        assert library.connection().execute(
+            "SELECT rowid FROM CARDS WHERE code = 2").fetchone() == rowid
+        assert [card.name for card in library.load_cards(
+            [2, 4], cache=False)] == ['Changed', 'New']
+
+    def test_save_while_iterating(self, library):
+        library.save_cards([Card(code, 'Test') for code in range(1, 1201)])
+        saved = 0
+        for card in library.retrieve_all(cache=False):
+            card.name += '!'
+            library.save_card(card)
+            saved += 1
+            assert saved <= 1200
+
+        assert saved == 1200
+        assert len(library.filter_search(name='Test!')) == 1200
+        assert library.filter_search(name='!!') == []
+
+    def test_insert_while_iterating(self, library):
+        library.save_cards([Card(code, 'Test') for code in range(1, 11)])
+        codes = []
+        for card in library.retrieve_all(cache=False, batch=3):
+            codes.append(card.code)
+            if card.code <= 10:
+                library.save_cards([Card(card.code + 100, 'New'),
+                                    Card(-card.code, 'Passed'),
+                                    Card(card.code, 'Changed')])
+
+        assert codes == list(range(1, 11)) + list(range(101, 111))
+
+    def test_load_string_code(self, library):
+        library.save_card(Card(1, 'Test'))
+        card = library.load_card('1')
+
+        assert library.load_card('1') is card
+        assert library.load_card(1) is card
+        assert library.cache_stats()['hits'] == 2
+
+    def test_load_missing(self, library):
+        assert library.load_card(404) is None
+
+    def test_load_cards(self, library):
+        library.save_cards([Card(code, 'Test') for code in range(1, 4)])
+        library.load_card(2)
+        cards = library.load_cards([3, 404, 2, 1, 3])
+
+        assert [card.code if card else None for card in cards] == \
+            [3, None, 2, 1, 3]
+        assert cards[0] is cards[4]
+
+    def test_load_cards_chunked(self, library):
+        library.save_cards([Card(code, 'Test') for code in range(1, 1201)])
+        cards = library.load_cards(range(1, 1201), cache=False)
+
+        assert [card.code for card in cards] == list(range(1, 1201))
+
+    def test_save_cards_replace(self, library):
+        library.save_cards([Card(1, 'Old'), Card(2, 'Test')])
+        library.save_cards([Card(1, 'New')])
+
+        assert library.load_card(1).name == 'New'
+        assert len(list(library.retrieve_all())) == 2
+
+    def test_legacy_rows(self, library):
+        card = Card(1, 'Test')
+        card.add_ability(1, 'Slap')
+        card.set_info('art', 1)
+        with library.connection() as carddb:
+            carddb.execute("INSERT INTO CARDS VALUES(?, ?, ?, ?, ?)",
+                           ["1", "Test", str(card.abilities), "['test']",
+                            str(card.info)])
+        loaded = library.load_card(1, cache=False)
+
+        assert loaded.abilities == {1: ['Slap']}
+        assert loaded.attributes == ['test']
+        assert library.migrate_codec(batch=1) == 1
+        assert library.migrate_codec() == 0
+        assert library.load_card(1, cache=False).info == card.info
+
+    def test_retrieve_all(self, library):
+        library.save_cards([Card(code, 'Test') for code in range(1, 8)])
+        library.load_card(3)
+        cached = library.card_cache.get(3)
+        cards = list(library.retrieve_all(batch=3))
+
+        assert sorted(card.code for card in cards) == list(range(1, 8))
+        assert cached in cards and cards[cards.index(cached)] is cached
+        assert library.cached(7)
+
+    def test_retrieve_all_uncached(self, library):
+        library.save_cards([Card(code, 'Test') for code in range(1, 4)])
+        list(library.retrieve_all(cache=False))
+
+        assert len(library.card_cache) == 0
+
+    def test_retrieve_all_fields(self, library):
+        card = Card(1, 'Test')
+        card.add_attribute('test')
+        library.save_card(card)
+
+        assert list(library.retrieve_all(fields=('name', 'attributes'))) == \
+            [{'name': 'Test', 'attributes': ['test']}]
+        with pytest.raises(ValueError):
+            list(library.retrieve_all(fields=('cost',)))
+
+    def test_retrieve_all_chunked(self, library):
+        library.save_cards([Card(code, 'Test') for code in range(1, 6)])
+        chunks = list(library.retrieve_all(chunked=True, batch=2))
+
+        assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+
+    def test_cached(self, library):
+        library.save_card(Card(1, 'Test'))
+
+        assert library.cached(1) is False
+        library.load_card(1)
+        assert library.cached(1) is True
+
+    def test_cachelimit(self, library):
+        library.cachelimit = 1
+        library.save_card(Card(1, 'Test'), cache=True)
+        library.save_card(Card(2, 'Test'), cache=True)
+
+        assert library.cached(1) is False
+        assert library.cached(2) is True
+        assert library.cache_stats()["evictions"] == 1
+
+    def test_connection_reused(self, library):
+        assert library.connection() is library.connection()
+
+    def test_connection_per_thread(self, library):
+        connections = []
+        thread = threading.Thread(
+            target=lambda: connections.append(library.connection()))
+        thread.start()
+        thread.join()
+
+        assert connections[0] is not library.connection()
+
+    def test_close(self, library):
+        first = library.connection()
+        library.close()
+
+        assert library.connection() is not first
+        library.save_card(Card(1, 'Test'))
+        assert library.load_card(1).name == 'Test'
+
+    def test_context_manager(self, tmpdir):
+        with Library(str(tmpdir.join("cards.db"))) as library:
+            library.create_db()
+            library.save_card(Card(1, 'Test'))
+        assert len(library._connections) == 0
+
+    def test_thread_connections_closed(self, library):
+        library.save_card(Card(1, 'Test'))
+        opened = []
+
+        def load():
+            library.load_card(1, cache=False)
+            opened.append(library.connection())
+
+        for _ in range(50):
+            thread = threading.Thread(target=load)
+            thread.start()
+            thread.join()
+
+        assert len(library._connections) == 1
+        with pytest.raises(sqlite3.ProgrammingError):
+            opened[0].execute("SELECT 1")
+
+    def test_compact_cardclass(self, tmpdir):
+        with Library(str(tmpdir.join("cards.db")),
+                     cardclass=CompactCard) as library:
+            card = Card(1, 'Test')
+            card.add_attribute('test')
+            library.save_card(card)
+            loaded = library.load_card(1)
+
+            assert isinstance(loaded, CompactCard)
+            assert loaded.has_attribute('test')
+            assert library.filter_search(attributes=['test']) == [(1, 'Test')]
+
+
+class TestMissingCards(object):
+
+    def queries(self, library):
+        queries = []
+        library.connection().set_trace_callback(
+            lambda command: command.startswith("SELECT *") and
+            queries.append(command))
+        return queries
+
+    @pytest.mark.parametrize("membership", [True, BloomFilter(1000)])
+    def test_membership(self, tmpdir, membership):
+        dbname = str(tmpdir.join("cards.db"))
+        with Library(dbname) as library:
+            library.save_card(Card(1, 'Test'))
+
+        with Library(dbname, membership=membership) as library:
+            queries = self.queries(library)
+            assert library.load_card(404) is None
+            assert library.load_cards([404, 405]) == [None, None]
+            assert queries == []
+            assert library.load_card(1).name == 'Test'
+
+            library.save_card(Card(404, 'Found'))
+            assert library.load_card(404).name == 'Found'
+
+    @pytest.mark.parametrize("membership", [True, BloomFilter(10000)])
+    def test_rebuild_membership_threads(self, tmpdir, membership):
+        library = Library(str(tmpdir.join("cards.db")),
+                          membership=membership)
+        library.save_cards(Card(code, 'Test') for code in range(1, 2001))
+        library.rebuild_membership()
+        stop = threading.Event()
+        missing = []
+
+        def load():
+            while not stop.is_set():
+                if library.load_card(2000, cache=False) is None:
+                    missing.append(2000)
+        reader = threading.Thread(target=load)
+        reader.start()
+        try:
+            for code in range(20):
+                library.rebuild_membership()
+                library.save_card(Card(3000 + code, 'New'))
+        finally:
+            stop.set()
+            reader.join()
+
+        assert missing == []
+        assert all(library.load_card(3000 + code, cache=False) is not None
+                   for code in range(20))
+        library.close()
+
+    def test_negative_cache(self, library):
+        library.negative_cache = NegativeCache(ttl=60)
+        queries = self.queries(library)
+
+        assert library.load_card(404) is None
+        assert library.load_cards([404, 405]) == [None, None]
+        assert library.load_cards([405]) == [None]
+        assert len(queries) == 2
+
+        library.save_card(Card(404, 'Found'))
+        assert library.load_card(404).name == 'Found'
+
+
+class TestDecks(object):
+
+    def test_save_load(self, library):
+        library.save_deck(Deck(cards=[1, 2, 1, 3]), 'first')
+        deck = library.load_deck('first')
+
+        assert deck.library is library
+        assert deck.cards == [1, 1, 2, 3]
+        assert library.load_deck('missing') is None
+
+    def test_replace_delete(self, library):
+        library.save_deck(Deck(cards=[1, 2]), 'first')
+        library.save_deck(Deck(cards=[3]), 'first')
+
+        assert library.load_deck('first').cards == [3]
+        library.delete_deck('first')
+        assert library.load_deck('first') is None
+
+    def test_load_decks(self, library):
+        library.save_deck(Deck(cards=[1]), 'first')
+        library.save_deck(Deck(cards=[2, 2]), 'second')
+        library.save_deck(Deck(cards=[3]), 'third')
+
+        decks = library.load_decks()
+        assert sorted(decks) == ['first', 'second', 'third']
+        assert decks['second'].cards == [2, 2]
+        decks = library.load_decks(['third', 'first'], compact=True)
+        assert sorted(decks) == ['first', 'third']
+        assert decks['third'].compact
+
+    def test_hydrate(self, library):
+        library.save_cards([Card(1, 'One'), Card(2, 'Two')])
+        library.save_deck(Deck(cards=[1, 2, 2, 404]), 'first')
+        queries = []
+        library.connection().set_trace_callback(queries.append)
+        deck = library.load_deck('first', hydrate=True)
+
+        assert len(queries) == 1
+        assert library.cached(1) and library.cached(2)
+        assert [deck.get_card(index, remove=False).name
+                for index in range(3)] == ['One', 'Two', 'Two']
+        assert len(queries) == 1
+
+
+class TestCoherence(object):
+
+    def test_changes_invalidate(self, searchable):
+        worker = Library(searchable.dbname, coherence=0)
+        worker.load_cards([1, 2, 3])
+        worker.card_index()
+        editor = Library(searchable.dbname)
+        card = Card(1, 'Fire Ant Queen')
+        card.add_attribute('royal')
+        editor.save_card(card)
+
+        assert worker.load_card(1).name == 'Fire Ant Queen'
+        assert worker.cached(2)
+        assert worker.cached(3)
+        assert '1' in worker.card_index().attribute_codes('royal')
+        assert '1' not in worker.card_index().attribute_codes('red')
+        editor.close()
+        worker.close()
+
+    def test_own_changes(self, searchable):
+        worker = Library(searchable.dbname, coherence=0)
+        worker.load_card(1)
+        worker.save_card(Card(4, 'Wisp'))
+
+        assert worker.refresh() == 0
+        assert worker.cached(1)
+        worker.close()
+
+    def test_interval(self, searchable):
+        worker = Library(searchable.dbname, coherence=3600)
+        worker.load_card(1)
+        searchable.save_card(Card(1, 'Changed'))
+
+        assert worker.load_card(1).name == 'Fire Ant'
+        assert worker.refresh() == 1
+        assert worker.load_card(1).name == 'Changed'
+        worker.close()
+
+    def test_pruned(self, searchable):
+        worker = Library(searchable.dbname, coherence=0,
+                         negative_ttl=60, membership=True)
+        worker.load_cards([1, 2, 3, 5])
+        searchable.save_card(Card(5, 'Late'))
+        searchable.save_card(Card(2, 'Changed'))
+        searchable.prune_changes(keep=1)
+
+        assert worker.load_card(1) is not None
+        assert not worker.cached(3)
+        assert worker.load_card(5).name == 'Late'
+        worker.close()
+
+    def test_trim_changes(self, library):
+        library.keep_changes = 5
+        for code in range(1, 21):
+            library.save_card(Card(code, 'Test'))
+        count, last = library.connection().execute(
+            "SELECT count(*), MAX(id) FROM CARD_CHANGES").fetchone()
+
+        assert 5 <= count < 10
+        assert last == 20
+        library.keep_changes = None
+        library.save_cards(Card(code, 'Test') for code in range(1, 21))
+        assert library.connection().execute(
+            "SELECT count(*) FROM CARD_CHANGES").fetchone()[0] == count + 20
+
+
+class TestTransactions(object):
+
+    def test_single_commit(self, library):
+        commits = []
+        library.connection().set_trace_callback(commits.append)
+        with library.transaction():
+            library.save_card(Card(1, 'Ant'))
+            with library.transaction():
+                library.save_card(Card(2, 'Wisp'))
+            library.save_deck(Deck(library, [1, 2]), 'Pair')
+        library.connection().set_trace_callback(None)
+
+        assert [sql for sql in commits if sql.startswith('BEGIN')] == \
+            ['BEGIN IMMEDIATE']
+        assert [sql for sql in commits if sql == 'COMMIT'] == ['COMMIT']
+        assert library.filter_search(name='') == [(1, 'Ant'), (2, 'Wisp')]
+
+    def test_rollback(self, library):
+        library.save_card(Card(1, 'Ant'))
+        index = library.card_index()
+        with pytest.raises(RuntimeError):
+            with library.transaction():
+                card = Card(2, 'Wisp')
+                card.add_attribute('ghost')
+                library.save_card(card, cache=True)
+                raise RuntimeError()
+
+        assert library.load_card(2) is None
+        assert not library.cached(2)
+        assert '2' not in index.attribute_codes('ghost')
+        assert library.load_card(1).name == 'Ant'
+
+    def test_uncommitted_invisible(self, library):
+        other = Library(library.dbname)
+        with library.transaction():
+            library.save_card(Card(1, 'Ant'))
+            assert library.load_card(1, cache=False).name == 'Ant'
+            assert other.load_card(1) is None
+        assert other.load_card(1).name == 'Ant'
+        other.close()
+
+    def test_wal(self, tmpdir):
+        library = Library(str(tmpdir.join('wal.db')), wal=True,
+                          pragmas={'cache_size': -1024})
+        carddb = library.connection()
+
+        assert carddb.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+        assert carddb.execute('PRAGMA synchronous').fetchone() == (1,)
+        assert carddb.execute('PRAGMA cache_size').fetchone() == (-1024,)
+        library.close()
+
+    def test_wal_reads_during_write(self, tmpdir):
+        dbname = str(tmpdir.join('wal.db'))
+        writer = Library(dbname, wal=True)
+        writer.save_card(Card(1, 'Ant'))
+        reader = Library(dbname, wal=True)
+        with writer.transaction():
+            writer.save_card(Card(1, 'Changed Ant'))
+            assert reader.load_card(1, cache=False).name == 'Ant'
+        writer.close()
+        reader.close()
+
+
+class TestProjection(object):
+
+    def test_load_fields(self, searchable):
+        assert searchable.load_card(1, fields=['name']) == dict(
+            name='Fire Ant')
+        assert searchable.load_card(9, fields=['name']) is None
+        assert searchable.load_cards([3, 9, 1], fields=['code', 'info']) == [
+            dict(code=3, info={'rarity': 'rare'}), None,
+            dict(code=1, info={'cost': [1]})]
+        assert not searchable.cached(1)
+
+    def test_search_fields(self, searchable):
+        assert searchable.filter_search(attributes=['red'],
+                                        fields=['code', 'attributes']) == [
+            dict(code=1, attributes=['insect', 'red']),
+            dict(code=3, attributes=['red'])]
+
+    def test_unknown_fields(self, searchable):
+        with pytest.raises(ValueError):
+            searchable.load_card(1, fields=['cost'])
+
+    def test_pack_fields(self, searchable, tmpdir):
+        path = str(tmpdir.join('cards.pack'))
+        searchable.export_pack(path)
+        packed = Library(str(tmpdir.join('none.db')), pack=path)
+
+        assert packed.load_cards([2, 7], fields=['name']) == [
+            dict(name='Ice 100% Ant'), None]
+        packed.pack.close()
+
+    def test_lazy_cards(self, searchable):
+        library = Library(searchable.dbname, cardclass=LazyCard)
+        card = library.load_card(1)
+
+        assert isinstance(card, LazyCard)
+        assert not card.decoded()
+        assert card.name == 'Fire Ant'
+        assert card.abilities == {'attack': ['Bite']}
+        assert library.load_cards([2])[0].get_abilities(3) == ['Thaw']
+        assert [deck_card.code for deck_card in
+                Deck(library, [1, 3]).top_cards(2, remove=False)] == [3, 1]
+        library.close()
+
+    def test_lazy_cards_cachesize(self, searchable):
+        library = Library(searchable.dbname, cardclass=LazyCard,
+                          cachesize=10 ** 6)
+        card = library.load_card(1)
+
+        assert library.cached(1)
+        assert not card.decoded()
+        size = library.card_cache.size
+        assert size > 0
+        card.abilities
+        assert library.card_cache.size > size
+        library.close()
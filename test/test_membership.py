@@ -0,0 +1,52 @@
+"""
+Tests for `librarian.membership` module.
+"""
+from librarian.membership import BloomFilter, CodeSet
+
+
+class TestCodeSet(object):
+
+    def test_add(self):
+        codes = CodeSet()
+        codes.add('1')
+
+        assert '1' in codes
+        assert '2' not in codes
+        codes.clear()
+        assert len(codes) == 0
+        assert len(codes.empty()) == 0
+
+
+class TestBloomFilter(object):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000)
+        for code in range(1000):
+            bloom.add(str(code))
+
+        assert len(bloom) == 1000
+        assert all(str(code) in bloom for code in range(1000))
+
+    def test_error_rate(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for code in range(1000):
+            bloom.add(str(code))
+        false = sum(1 for code in range(1000, 11000) if str(code) in bloom)
+
+        assert false < 300
+
+    def test_clear(self):
+        bloom = BloomFilter(capacity=10)
+        bloom.add('1')
+        bloom.clear()
+
+        assert '1' not in bloom
+
+    def test_empty(self):
+        bloom = BloomFilter(capacity=10)
+        bloom.add('1')
+        empty = bloom.empty()
+
+        assert '1' not in empty
+        assert len(empty.bits) == len(bloom.bits)
+        assert empty.hashes == bloom.hashes
@@ -0,0 +1,98 @@
+"""
+Tests for `librarian.metrics` module.
+"""
+import logging
+import pytest
+from librarian.card import Card
+from librarian.library import Library
+from librarian.metrics import Metrics
+
+
+@pytest.fixture
+def events():
+    return []
+
+
+@pytest.fixture
+def library(tmpdir, events):
+    library = Library(str(tmpdir.join('metrics.db')),
+                      metrics=Metrics(callback=events.append,
+                                      step_interval=10))
+    library.create_db()
+    cards = []
+    for code in range(1, 21):
+        card = Card(code, 'Card {0}'.format(code))
+        card.add_attribute('even' if code % 2 == 0 else 'odd')
+        cards.append(card)
+    library.save_cards(cards)
+    yield library
+    library.close()
+
+
+class TestMetrics(object):
+
+    def test_operations(self, library):
+        library.load_card(1)
+        library.load_card(1)
+        library.load_cards([2, 3, 99])
+        library.filter_search(attributes=['even'])
+        operations = library.stats()['operations']
+
+        assert operations['save_cards']['rows'] == 20
+        assert operations['load_card']['calls'] == 2
+        assert operations['select_card']['calls'] == 1
+        assert operations['load_cards']['rows'] == 2
+        assert operations['filter_search']['rows'] == 10
+        assert operations['filter_search']['steps'] > 0
+        assert operations['filter_search']['mean_seconds'] >= 0
+        assert library.stats()['cache']['hits'] == 1
+
+    def test_generator(self, library, events):
+        del events[:]
+        assert len(list(library.retrieve_all(cache=False))) == 20
+        for _ in library.retrieve_all(batch=5, chunked=True):
+            break
+
+        assert [(event['operation'], event['rows']) for event in events] == \
+            [('retrieve_all', 20), ('retrieve_all', 5)]
+
+    def test_errors(self, library):
+        with pytest.raises(Exception):
+            library.text_search('fire')
+        totals = library.stats()['operations']['text_search']
+
+        assert totals['calls'] == 1
+        assert totals['errors'] == 1
+
+    def test_slow_query(self, tmpdir, caplog):
+        library = Library(str(tmpdir.join('slow.db')),
+                          metrics=Metrics(slow_query=0))
+        library.create_db()
+        with caplog.at_level(logging.WARNING, logger='librarian.metrics'):
+            library.filter_search(name='Ant')
+        library.close()
+
+        assert "Slow filter_search" in caplog.text
+        assert "LIKE '%Ant%'" in caplog.text
+
+    def test_slow_query_untraced(self, caplog):
+        class Connection(object):
+            def set_progress_handler(self, handler, steps):
+                self.progress = handler
+        metrics = Metrics(slow_query=0)
+        metrics.attach(Connection())
+        with caplog.at_level(logging.WARNING, logger='librarian.metrics'):
+            metrics.record('load_card', 0.5)
+
+        assert "Slow load_card took 0.500 seconds" in caplog.text
+
+    def test_reset(self, library):
+        library.metrics.reset()
+
+        assert library.stats()['operations'] == {}
+
+    def test_disabled(self, tmpdir):
+        library = Library(str(tmpdir.join('plain.db')))
+
+        assert 'load_card' not in vars(library)
+        assert library.stats()['operations'] == {}
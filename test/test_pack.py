@@ -0,0 +1,76 @@
+"""
+Tests for `librarian.pack` module.
+"""
+import sqlite3
+import pytest
+from librarian.card import Card
+from librarian.library import Library
+from librarian.pack import CardPack, write_pack
+
+
+@pytest.fixture
+def library(tmpdir):
+    library = Library(str(tmpdir.join("cards.db")))
+    cards = []
+    for code in (5, 1, 3, 100, 2):
+        card = Card(code, 'Card {0}'.format(code))
+        card.add_ability(1, 'Slap')
+        card.add_attribute('odd' if code % 2 else 'even')
+        cards.append(card)
+    library.save_cards(cards)
+    yield library
+    library.close()
+
+
+class TestCardPack(object):
+
+    def test_write_read(self, tmpdir):
+        path = str(tmpdir.join("cards.pack"))
+        count = write_pack(path, [Card(code, 'Test').save()
+                                  for code in (3, -1, 2)])
+
+        with CardPack(path) as pack:
+            assert count == len(pack) == 3
+            assert list(pack.codes()) == [-1, 2, 3]
+            assert pack.get(2)['name'] == 'Test'
+            assert pack.get('3')['code'] == 3
+            assert pack.get(4) is None
+            assert pack.get('x') is None
+            assert -1 in pack
+            assert [carddict['code'] for carddict in pack] == [-1, 2, 3]
+
+    def test_bad_codes(self, tmpdir):
+        path = str(tmpdir.join("cards.pack"))
+        with pytest.raises(ValueError):
+            write_pack(path, [Card('abc').save()])
+        with pytest.raises(ValueError):
+            write_pack(path, [Card(1).save(), Card(1).save()])
+        assert not tmpdir.listdir()
+
+    def test_not_pack(self, tmpdir):
+        path = tmpdir.join("cards.pack")
+        path.write("definitely not a card pack")
+        with pytest.raises(ValueError):
+            CardPack(str(path))
+
+    def test_library_pack(self, library, tmpdir):
+        path = str(tmpdir.join("cards.pack"))
+        assert library.export_pack(path) == 5
+
+        packed = Library(None, pack=path)
+        card = packed.load_card(3)
+        assert card.name == 'Card 3'
+        assert card.get_abilities(1) == ['Slap']
+        assert packed.cached(3)
+        assert packed.load_card(4) is None
+        assert [card.code for card in packed.load_cards([100, 4, '1'])
+                if card] == [100, 1]
+        assert [card.code for card in packed.retrieve_all()] == \
+            [1, 2, 3, 5, 100]
+        assert list(packed.retrieve_all(fields=('code',), batch=2)) == \
+            [{'code': code} for code in (1, 2, 3, 5, 100)]
+        assert packed.card_index().attribute_codes('odd') == \
+            set(['1', '3', '5'])
+        with pytest.raises(sqlite3.OperationalError):
+            packed.save_card(Card(7))
+        packed.pack.close()
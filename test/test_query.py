@@ -0,0 +1,117 @@
+"""
+Tests for `librarian.query` module.
+"""
+import pytest
+from librarian.card import Card
+from librarian.library import Library
+from librarian.query import CodeIn, CodeRange, Query, Where
+
+
+NAMES = ['Ant', 'Drake', 'Golem', 'Wisp']
+
+
+@pytest.fixture
+def library(tmpdir):
+    library = Library(str(tmpdir.join('query.db')))
+    cards = []
+    for code in range(1, 41):
+        card = Card(code, '{0} {1}'.format(NAMES[code % 4], code))
+        card.add_attribute('red' if code % 2 else 'blue')
+        if code % 3 == 0:
+            card.add_attribute('flying')
+        card.set_info('cost', code % 5, False)
+        cards.append(card)
+    library.save_cards(cards)
+    yield library
+    library.close()
+
+
+def codes(results):
+    return [result.code for result in results]
+
+
+class TestQuery(object):
+
+    def test_filters(self, library):
+        assert codes(library.query(attributes=['red', 'flying'])) == \
+            [3, 9, 15, 21, 27, 33, 39]
+        assert codes(library.query(Where(name='Ant') | CodeRange(38))) == \
+            [4, 8, 12, 16, 20, 24, 28, 32, 36, 38, 39, 40]
+        assert codes(library.query(~Where(attributes=['red']),
+                                   CodeRange(1, 10))) == [2, 4, 6, 8, 10]
+        assert codes(library.query(CodeIn([5, 50, 1]))) == [1, 5]
+        assert codes(library.query(CodeIn([]))) == []
+
+    def test_compose(self, library):
+        red = library.query(attributes=['red'])
+        cheap = red.where(info={'cost': 0})
+
+        assert codes(cheap) == [5, 15, 25, 35]
+        assert codes(cheap | Where(code=2)) == [2, 5, 15, 25, 35]
+        assert len(red.all()) == 20
+
+    def test_parameterized(self, library):
+        command, params = library.query(
+            name="'; DROP TABLE CARDS; --").compile()
+
+        assert "DROP" not in command
+        assert library.query(name="'; DROP TABLE CARDS; --").all() == []
+        assert library.query().count() == 40
+
+    def test_order_limit(self, library):
+        query = library.query(CodeRange(1, 8)).order_by('-name')
+
+        assert [card.name for card in query.limit(3)] == \
+            ['Wisp 7', 'Wisp 3', 'Golem 6']
+        assert query.first().code == 7
+        assert query.limit(3).count() == 8
+
+    def test_select(self, library):
+        results = library.query(code=3).select('name', 'attributes').all()
+
+        assert results == [dict(name='Wisp 3', attributes=['red', 'flying'],
+                                code=3)]
+
+    @pytest.mark.parametrize('order', [(), ('name',), ('-name', '-code')])
+    def test_pages(self, library, order):
+        query = library.query(attributes=['blue']).order_by(*order)
+        expected = codes(query)
+        pages = list(query.pages(6))
+
+        assert [len(page) for page in pages] == [6, 6, 6, 2]
+        assert [card.code for page in pages for card in page] == expected
+
+    def test_after_selected(self, library):
+        query = library.query().order_by('name').select('code')
+        first = query.limit(5).all()
+
+        assert first[-1] == dict(code=28, name='Ant 28')
+        assert query.after(first[-1]).limit(2).all() == [
+            dict(code=32, name='Ant 32'), dict(code=36, name='Ant 36')]
+        assert query.after(('Ant 28', 28)).first()['code'] == 32
+
+    def test_streams(self, library):
+        results = iter(Query(library, batch=4))
+
+        assert next(results).code == 1
+        assert len(list(results)) == 39
+
+    def test_cache(self, library):
+        library.query(code=1).all()
+        assert library.cached(1)
+        Query(library, cache=False).where(code=2).all()
+        assert not library.cached(2)
+
+    def test_changes_invalidate(self, library):
+        worker = Library(library.dbname, coherence=0)
+        worker.query(code=1).all()
+        library.save_card(Card(1, 'Queen 1'))
+
+        assert worker.query(code=1).first().name == 'Queen 1'
+        worker.close()
+
+    def test_invalid(self, library):
+        with pytest.raises(ValueError):
+            library.query().order_by('info')
+        with pytest.raises(ValueError):
+            Where(cost=1)
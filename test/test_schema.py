@@ -0,0 +1,74 @@
+"""
+Tests for `librarian.schema` module.
+"""
+import sqlite3
+import pytest
+from librarian import schema
+from librarian.library import Library
+
+
+@pytest.fixture
+def legacy_db(tmpdir):
+    dbname = str(tmpdir.join("legacy.db"))
+    carddb = sqlite3.connect(dbname)
+    carddb.execute("""CREATE TABLE CARDS(code STRING, name STRING,
+    abilities STRING, attributes STRING, info STRING)""")
+    carddb.executemany("INSERT INTO CARDS VALUES(?, ?, ?, ?, ?)", [
+        ["1", "Old", "{}", "['old']", "{}"],
+        ["2", "Other", "{}", "[]", "{}"],
+        ["1", "New", "{}", "['test']", "{}"],
+    ])
+    carddb.commit()
+    carddb.close()
+    return dbname
+
+
+class TestSchema(object):
+
+    def test_create(self, tmpdir):
+        library = Library(str(tmpdir.join("cards.db")))
+
+        assert schema.version(library.connection()) == schema.SCHEMA_VERSION
+        assert library.create_db() == 0
+
+    def test_upgrade_deduplicates(self, legacy_db):
+        library = Library(legacy_db)
+        carddb = library.connection()
+
+        assert schema.version(carddb) == schema.SCHEMA_VERSION
+        assert carddb.execute("SELECT count(*) FROM CARDS").fetchone() == (2,)
+        card = library.load_card(1)
+        assert card.name == "New"
+        assert card.attributes == ["test"]
+        assert library.filter_search(attributes=["test"]) == [(1, "New")]
+        assert library.filter_search(attributes=["old"]) == []
+
+    def test_lookup_uses_index(self, tmpdir):
+        library = Library(str(tmpdir.join("cards.db")))
+        carddb = library.connection()
+        plan = carddb.execute("EXPLAIN QUERY PLAN "
+                              "SELECT * FROM CARDS WHERE code = ?", (1,))
+
+        assert "USING INDEX" in " ".join(str(row) for row in plan)
+
+    def test_card_changes(self, legacy_db):
+        library = Library(legacy_db)
+        carddb = library.connection()
+        with carddb:
+            carddb.execute("UPDATE CARDS SET name = 'Newer' WHERE code = 1")
+            carddb.execute("DELETE FROM CARDS WHERE code = 2")
+
+        assert carddb.execute("SELECT code FROM CARD_CHANGES ORDER BY id"
+                              ).fetchall() == [(1,), (2,)]
+
+    def test_upgrade_rollback(self, legacy_db, monkeypatch):
+        def broken(carddb, library):
+            carddb.execute("DROP TABLE CARDS")
+            raise RuntimeError()
+        monkeypatch.setattr(schema, "MIGRATIONS", [broken])
+        carddb = sqlite3.connect(legacy_db)
+
+        with pytest.raises(RuntimeError):
+            schema.upgrade(carddb, None)
+        assert schema.version(carddb) == 0
+        assert schema.table_exists(carddb, "CARDS")
@@ -0,0 +1,113 @@
+"""
+Tests for `librarian.sharded` module.
+"""
+import pytest
+from librarian.card import Card
+from librarian.deck import Deck
+from librarian.library import Library
+from librarian.sharded import ShardedLibrary, shard_index
+
+
+def make_card(code):
+    card = Card(code, 'Card {0}'.format(code))
+    card.add_attribute('red' if code % 2 else 'blue')
+    card.add_ability('attack', 'Hit {0}'.format(code))
+    card.set_info('cost', code % 3, False)
+    return card
+
+
+@pytest.fixture
+def sharded(tmpdir):
+    library = ShardedLibrary([str(tmpdir.join('shard{0}.db'.format(number)))
+                              for number in range(4)], fulltext=True)
+    library.create_db()
+    library.save_cards(make_card(code) for code in range(1, 101))
+    yield library
+    library.close()
+
+
+class TestShardedLibrary(object):
+
+    def test_routing(self, sharded):
+        counts = [len(list(shard.retrieve_all(cache=False)))
+                  for shard in sharded.shards]
+
+        assert sum(counts) == 100
+        assert all(count > 10 for count in counts)
+        assert shard_index(7, 4) == shard_index('7', 4)
+        assert sharded.library(7).load_card(7, cache=False).name == 'Card 7'
+        for number, shard in enumerate(sharded.shards):
+            if number != sharded.shard(7):
+                assert shard.load_card(7) is None
+
+    def test_load(self, sharded):
+        assert sharded.load_card(42).name == 'Card 42'
+        assert sharded.cached(42)
+        assert [card and card.code for card in sharded.load_cards(
+            [5, 500, 3, 5])] == [5, None, 3, 5]
+        assert sharded.load_cards([8], fields=['name']) == [
+            dict(name='Card 8')]
+
+    def test_search(self, sharded):
+        assert sorted(sharded.filter_search(attributes=['blue'],
+                                            info={'cost': 0})) == [
+            (code, 'Card {0}'.format(code)) for code in range(6, 101, 6)]
+        assert sharded.filter_search(code=9) == [(9, 'Card 9')]
+        assert sharded.text_search('"Hit 77"') == [(77, 'Card 77')]
+        assert len(sharded.text_search('hit', limit=15)) == 15
+
+    def test_retrieve_all(self, sharded):
+        assert sorted(card.code for card in sharded.retrieve_all()) == \
+            list(range(1, 101))
+        chunks = list(sharded.retrieve_all(fields=['code'], chunked=True,
+                                           batch=10))
+        assert all(len(chunk) <= 10 for chunk in chunks)
+        assert sum(len(chunk) for chunk in chunks) == 100
+
+    def test_retrieve_all_early_exit(self, sharded):
+        for card in sharded.retrieve_all(batch=1):
+            assert sharded.load_cards([card.code, 1])[0] is card
+            break
+
+    def test_retrieve_all_connections(self, sharded):
+        def connections():
+            return [len(shard._connections) for shard in sharded.shards]
+        opened = connections()
+
+        for _ in range(20):
+            assert len(list(sharded.retrieve_all(cache=False))) == 100
+        for card in sharded.retrieve_all(batch=1):
+            break
+        sharded._card_index = None
+        sharded.card_index()
+
+        assert connections() == opened
+
+    def test_deck(self, sharded):
+        deck = Deck(sharded, [1, 2, 3, 4, 5, 1])
+
+        assert deck.contians_attribute('red') == 4
+        assert deck.attribute_histogram() == {'red': 4, 'blue': 2}
+        assert sorted(card.code for card in deck.top_cards(
+            6, remove=False)) == [1, 1, 2, 3, 4, 5]
+        sharded.save_card(Card(2, 'Recoloured'))
+        assert deck.contians_attribute('red') == 4
+        assert deck.contains_info('cost', 1) == 3
+
+    def test_cache_stats(self, sharded):
+        sharded.load_card(1)
+        sharded.load_card(1)
+        stats = sharded.cache_stats()
+
+        assert stats['hits'] == 1
+        assert stats['cards'] >= 1
+
+    def test_empty(self):
+        with pytest.raises(ValueError):
+            ShardedLibrary([])
+
+    def test_single_shard(self, tmpdir):
+        with ShardedLibrary([str(tmpdir.join('one.db'))]) as library:
+            library.save_card(make_card(1))
+            assert library.load_card(1).name == 'Card 1'
+            assert isinstance(library.shards[0], Library)
@@ -0,0 +1,42 @@
+"""
+Tests for `librarian.simulate` module.
+"""
+import pytest
+from librarian.simulate import simulate
+
+
+def has_one(hand):
+    return 1 in hand
+
+
+class TestSimulate(object):
+
+    def test_probability(self):
+        result = simulate([1, 0, 0, 0], 4000, 1, has_one, seed=7,
+                          processes=1, batch=1000)
+
+        assert result["trials"] == 4000
+        assert result["seed"] == 7
+        assert result["probability"] == pytest.approx(0.25, abs=0.05)
+        assert result["stderr"] > 0
+
+    def test_certain(self):
+        result = simulate([1, 0, 0], 100, 3, has_one, processes=1)
+
+        assert result["successes"] == 100
+        assert result["stderr"] == 0
+
+    def test_reproducible(self):
+        features = [1] + [0] * 39
+        first = simulate(features, 3000, 7, has_one, seed=3, processes=1,
+                         batch=500)
+        second = simulate(features, 3000, 7, has_one, seed=3, processes=2,
+                          batch=500)
+
+        assert first == second
+
+    def test_hand_size(self):
+        with pytest.raises(ValueError):
+            simulate([1, 2], 10, 3, has_one)
+        with pytest.raises(ValueError):
+            simulate([1, 2], 10, 0, has_one)
@@ -0,0 +1,77 @@
+"""
+Tests for `librarian.stream` module.
+"""
+import io
+import pytest
+from librarian.card import Card
+from librarian.library import Library
+from librarian.stream import parse_records, parse_stream, read_records
+
+
+def make_cards(count):
+    cards = []
+    for code in range(1, count + 1):
+        card = Card(code, 'Card, "{0}"'.format(code))
+        card.add_attribute('odd' if code % 2 else 'even')
+        card.add_ability(3, 'Ability {0}'.format(code))
+        card.set_info('cost', code % 5, False)
+        cards.append(card)
+    return cards
+
+
+@pytest.fixture
+def library(tmpdir):
+    library = Library(str(tmpdir.join('source.db')))
+    library.create_db()
+    library.save_cards(make_cards(25))
+    yield library
+    library.close()
+
+
+class TestStream(object):
+
+    def test_parse_csv(self):
+        lines = ['code,name,attributes\n', '1,Ant,"[""insect""]"\n', '2,,\n']
+        carddicts = parse_records('csv', read_records(lines, 'csv'))
+
+        assert carddicts[0] == dict(code='1', name='Ant', abilities={},
+                                    attributes=['insect'], info={})
+        assert carddicts[1]['name'] == ''
+
+    def test_parse_stream_processes(self):
+        lines = ['{{"code":{0},"name":"Card"}}\n'.format(code)
+                 for code in range(100)]
+        chunks = list(parse_stream(lines, 'jsonl', batch=7, processes=2))
+
+        assert [len(chunk) for chunk in chunks] == [7] * 14 + [2]
+        assert [carddict['code'] for chunk in chunks
+                for carddict in chunk] == list(range(100))
+
+    @pytest.mark.parametrize('format', ['jsonl', 'csv'])
+    def test_round_trip(self, library, tmpdir, format):
+        path = str(tmpdir.join('cards.' + format))
+        reports = []
+
+        assert library.export_stream(path, format, batch=10) == 25
+        target = Library(str(tmpdir.join('target.db')))
+        assert target.import_stream(path, format, batch=10,
+                                    progress=reports.append) == 25
+        assert [report['cards'] for report in reports] == [10, 20, 25]
+        assert target.load_cards(range(1, 26)) == make_cards(25)
+        assert target.filter_search(abilities={3: 'Ability 4'}) == \
+            [(4, 'Card, "4"')]
+        target.close()
+
+    def test_file_objects(self, library, tmpdir):
+        output = io.StringIO()
+        library.export_stream(output)
+        target = Library(str(tmpdir.join('target.db')))
+
+        assert target.import_stream(io.StringIO(output.getvalue()),
+                                    processes=2, batch=4) == 25
+        assert target.load_card(25) == make_cards(25)[-1]
+        target.close()
+
+    def test_unknown_format(self, library):
+        with pytest.raises(ValueError):
+            library.import_stream([], format='xml')